@@ -61,6 +61,16 @@ SERVER_PATH = r".\server"
 # advanced_tracking_manager: Optional[AdvancedTrackingManager] = None
     
 
+def batch():
+    """
+    Group edits made by another plugin into a single injection, rolled back if the block raises:
+
+        with server.get_plugin_instance('advanced_tracking').batch():
+            ...
+    """
+    return command_manager.script_loader.batch()
+
+
 def on_load(server:PluginServerInterface, prev):
     global command_manager, config
     print("AdvancedTracking plugin is loading...")
@@ -79,5 +89,7 @@ def on_unload(server:PluginServerInterface):
     print("AdvancedTracking plugin is unloading...")
     global command_manager, config
     # command_manager.unregister_commands()
+    command_manager.script_loader.close()
+    command_manager.script_loader.flush_data()
     config = Config.get()
     server.save_config_simple(config)
@@ -0,0 +1,184 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Area = Dict[str, int]
+
+AXES: Tuple[str, ...] = ('x', 'y', 'z')
+
+# size of the buckets used by the spatial index, the same as a minecraft chunk
+CHUNK_SIZE = 16
+
+# areas covering more chunks than this are not bucketed, and are checked on every event instead
+MAX_INDEXED_CHUNKS = 4096
+
+
+def axis_bounds(area: Area, axis: str) -> Tuple[Optional[int], Optional[int]]:
+    '''
+    get the (min, max) bounds of an area on one axis, None means unbounded
+    '''
+    return area.get(axis + '_min'), area.get(axis + '_max')
+
+
+def intersect_areas(a: Area, b: Area) -> Optional[Area]:
+    '''
+    intersect two areas, returns None if they do not overlap
+    '''
+    result: Area = {}
+    for axis in AXES:
+        a_min, a_max = axis_bounds(a, axis)
+        b_min, b_max = axis_bounds(b, axis)
+        lo = a_min if b_min is None else b_min if a_min is None else max(a_min, b_min)
+        hi = a_max if b_max is None else b_max if a_max is None else min(a_max, b_max)
+        if lo is not None and hi is not None and lo > hi:
+            return None
+        if lo is not None:
+            result[axis + '_min'] = lo
+        if hi is not None:
+            result[axis + '_max'] = hi
+    return result
+
+
+def chunk_range(area: Area) -> Optional[Tuple[int, int, int, int]]:
+    '''
+    get the (cx_min, cx_max, cz_min, cz_max) chunk range covered by an area
+
+    returns None if the area is unbounded on x or z, or covers too many chunks to be indexed
+    '''
+    x_min, x_max = axis_bounds(area, 'x')
+    z_min, z_max = axis_bounds(area, 'z')
+    if x_min is None or x_max is None or z_min is None or z_max is None:
+        return None
+    cx_min, cx_max = x_min // CHUNK_SIZE, x_max // CHUNK_SIZE
+    cz_min, cz_max = z_min // CHUNK_SIZE, z_max // CHUNK_SIZE
+    if (cx_max - cx_min + 1) * (cz_max - cz_min + 1) > MAX_INDEXED_CHUNKS:
+        return None
+    return cx_min, cx_max, cz_min, cz_max
+
+
+def chunk_key(cx: int, cz: int) -> str:
+    '''
+    key of a chunk inside the spatial index, must match the one built by the carpet script
+    '''
+    return f'{cx},{cz}'
+
+
+def bounding_box(areas: Iterable[Area]) -> Area:
+    '''
+    smallest area enclosing all the given areas, an axis is left open if any of them is open on it
+    '''
+    areas = list(areas)
+    result: Area = {}
+    if not areas:
+        return result
+    for axis in AXES:
+        mins = [area.get(axis + '_min') for area in areas]
+        maxs = [area.get(axis + '_max') for area in areas]
+        if None not in mins:
+            result[axis + '_min'] = min(mins)
+        if None not in maxs:
+            result[axis + '_max'] = max(maxs)
+    return result
+
+
+def horizontal_gap(a: Area, b: Area) -> Optional[int]:
+    '''
+    chebyshev distance between two areas on the x-z plane, None if either is open on x or z
+    '''
+    gap = 0
+    for axis in ('x', 'z'):
+        a_min, a_max = axis_bounds(a, axis)
+        b_min, b_max = axis_bounds(b, axis)
+        if None in (a_min, a_max, b_min, b_max):
+            return None
+        gap = max(gap, b_min - a_max, a_min - b_max)
+    return gap
+
+
+def contains(outer: Area, inner: Area) -> bool:
+    '''
+    whether every point of inner is inside outer
+    '''
+    for axis in AXES:
+        outer_min, outer_max = axis_bounds(outer, axis)
+        inner_min, inner_max = axis_bounds(inner, axis)
+        if outer_min is not None and (inner_min is None or inner_min < outer_min):
+            return False
+        if outer_max is not None and (inner_max is None or inner_max > outer_max):
+            return False
+    return True
+
+
+def merge_areas(a: Area, b: Area) -> Optional[Area]:
+    '''
+    the union of two areas if it is itself an area, i.e. they have the same bounds on two axes and
+    overlap or touch on the third one, None otherwise
+
+    positions are continuous, so [0, 5] and [5, 9] merge but [0, 5] and [6, 9] do not
+    '''
+    differing = [axis for axis in AXES if axis_bounds(a, axis) != axis_bounds(b, axis)]
+    if not differing:
+        return dict(a)
+    if len(differing) > 1:
+        return None
+    axis = differing[0]
+    a_min, a_max = axis_bounds(a, axis)
+    b_min, b_max = axis_bounds(b, axis)
+    if a_max is not None and b_min is not None and b_min > a_max:
+        return None
+    if b_max is not None and a_min is not None and a_min > b_max:
+        return None
+    result = dict(a)
+    result.pop(axis + '_min', None)
+    result.pop(axis + '_max', None)
+    if a_min is not None and b_min is not None:
+        result[axis + '_min'] = min(a_min, b_min)
+    if a_max is not None and b_max is not None:
+        result[axis + '_max'] = max(a_max, b_max)
+    # keep the usual x, y, z key order
+    return {key: result[key] for key in sorted(result, key=lambda key: (AXES.index(key[0]), key.endswith('_max')))}
+
+
+def volume(area: Area) -> float:
+    '''
+    number of blocks in the area, inf if it is open on any axis
+    '''
+    result = 1
+    for axis in AXES:
+        lo, hi = axis_bounds(area, axis)
+        if lo is None or hi is None:
+            return float('inf')
+        result *= hi - lo + 1
+    return result
+
+
+def normalize_areas(areas: List[Area]) -> List[Tuple[Area, int]]:
+    '''
+    an equivalent set of areas for "is the point in any of them" checks: areas contained in another are
+    dropped, and pairs whose union is an area are merged, until neither applies
+
+    returns the areas with the position of the input area they came from (the first one for merges),
+    largest first, so the area most likely to contain a point is checked first
+    '''
+    items: List[Tuple[Area, int]] = [(area, position) for position, area in enumerate(areas)]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(items)):
+            for j in range(i + 1, len(items)):
+                (a, a_source), (b, b_source) = items[i], items[j]
+                if contains(a, b):
+                    merged = (a, a_source)
+                elif contains(b, a):
+                    merged = (b, b_source)
+                else:
+                    area = merge_areas(a, b)
+                    if area is None:
+                        continue
+                    merged = (area, min(a_source, b_source))
+                items[i] = merged
+                del items[j]
+                changed = True
+                break
+            if changed:
+                break
+    items.sort(key=lambda item: (-volume(item[0]), item[1]))
+    return items
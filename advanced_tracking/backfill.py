@@ -0,0 +1,287 @@
+"""
+Retroactive counting of trackers from the event journal the script writes
+
+The journal has one line per block event (see journal_event in the script). It is loaded into numpy columns,
+so a tracker is evaluated against every event with a few array operations instead of replaying them one by one.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple, Any, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from advanced_tracking.area import Area, AXES
+from advanced_tracking.tracker import Tracker
+from advanced_tracking.utils.reference_evaluator import block_filter_matches
+
+# event code in the journal -> tracker type
+EVENT_TYPES: Dict[str, str] = {
+    "b": "player_break_blocks",
+    "p": "player_place_blocks",
+}
+
+# code of the lines begin_backfill writes into the journal
+MARKER_CODE = "m"
+# code of the line starting every segment, with the unix time in ms it was started at
+START_CODE = "s"
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+class JournalPrunedError(Exception):
+    """
+    The journal was pruned after the tracker was created, so recounting it would lose counts from before the
+    oldest segment left
+    """
+    def __init__(self, start: Optional[float]):
+        super().__init__(start)
+        # unix time of the oldest segment left, None if it isn't known
+        self.start: Optional[float] = start
+
+
+def _parse_state(state: str) -> Dict[str, str]:
+    if state == "-":
+        return {}
+    return dict(pair.split("=", 1) for pair in state.split(";"))
+
+
+class EventJournal:
+    """
+    Columns of the journal, loaded incrementally: only the lines appended since the last load are parsed
+
+    the journal is a directory of numbered segments (see flush_journal in the script), the events of the segments
+    the script pruned are dropped
+    players, dimensions and (block, state) pairs are stored as codes into the matching lists
+    """
+    def __init__(self, path: str|Path):
+        if np is None:
+            raise RuntimeError("numpy is required to load the event journal")
+        # the journal directory
+        self.path: Path = Path(path)
+        # segment -> bytes of its file already parsed
+        self._offsets: Dict[int, int] = {}
+        # segment -> unix time it was started at
+        self._starts: Dict[int, float] = {}
+        self.players: List[str] = []
+        self.dimensions: List[str] = []
+        self.blocks: List[Tuple[str, Dict[str, str]]] = []
+        self._player_codes: Dict[str, int] = {}
+        self._dimension_codes: Dict[str, int] = {}
+        self._block_codes: Dict[Tuple[str, str], int] = {}
+        self.types = np.zeros(0, dtype=np.int8)
+        self.player_column = np.zeros(0, dtype=np.int32)
+        self.dimension_column = np.zeros(0, dtype=np.int16)
+        self.block_column = np.zeros(0, dtype=np.int32)
+        self.positions = np.zeros((0, 3), dtype=np.float64)
+        self.segment_column = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @staticmethod
+    def _intern(value: Any, codes: Dict[Any, int], values: List) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def segments(self) -> List[Tuple[int, Path]]:
+        """
+        (number, file) of every segment on disk, oldest first
+        """
+        found = []
+        if self.path.is_dir():
+            for entry in self.path.iterdir():
+                if entry.suffix == ".txt" and entry.stem.isdigit():
+                    found.append((int(entry.stem), entry))
+        return sorted(found)
+
+    def _drop(self, segments: List[int]) -> None:
+        keep = ~np.isin(self.segment_column, segments)
+        self.types = self.types[keep]
+        self.player_column = self.player_column[keep]
+        self.dimension_column = self.dimension_column[keep]
+        self.block_column = self.block_column[keep]
+        self.positions = self.positions[keep]
+        self.segment_column = self.segment_column[keep]
+        for segment in segments:
+            self._offsets.pop(segment, None)
+            self._starts.pop(segment, None)
+
+    @property
+    def pruned(self) -> bool:
+        """
+        Whether the first segment is gone, so the journal no longer holds every event since it was started
+        """
+        return bool(self._offsets) and 0 not in self._offsets
+
+    @property
+    def start(self) -> Optional[float]:
+        """
+        unix time of the oldest segment loaded, None if nothing was loaded or the segment has no start line
+        """
+        if not self._offsets:
+            return None
+        return self._starts.get(min(self._offsets))
+
+    def covers(self, since: float) -> bool:
+        """
+        Whether every event from the unix time on is in the loaded segments
+        """
+        if not self.pruned:
+            return True
+        start = self.start
+        return start is not None and start <= since
+
+    def load(self) -> int:
+        """
+        Parse the lines appended since the last call, returns how many events were added.
+        """
+        return self._load(None)[0]
+
+    def load_until(self, marker: str) -> bool:
+        """
+        Parse the lines appended since the last call up to the marker line, returns whether it was reached.
+        The events after it are left for the next load.
+        """
+        return self._load(marker)[1]
+
+    def _load(self, marker: Optional[str]) -> Tuple[int, bool]:
+        segments = self.segments()
+        files = dict(segments)
+        # pruned by the script, or started over under the same number
+        gone = [segment for segment, offset in self._offsets.items()
+                if segment not in files or files[segment].stat().st_size < offset]
+        if gone:
+            self._drop(gone)
+        added = 0
+        for segment, path in segments:
+            count, reached = self._load_segment(segment, path, marker)
+            added += count
+            if reached:
+                return added, True
+        return added, False
+
+    def _load_segment(self, segment: int, path: Path, marker: Optional[str]) -> Tuple[int, bool]:
+        offset = self._offsets.get(segment, 0)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            raw = f.read()
+        reached = False
+        # a line still being written is left for the next load
+        end = raw.rfind(b"\n") + 1
+        if marker is not None:
+            marker_line = f"{MARKER_CODE} {marker}\n".encode("utf-8")
+            position = raw.find(marker_line)
+            if position >= 0:
+                end = position + len(marker_line)
+                reached = True
+        if end == 0:
+            return 0, reached
+        self._offsets[segment] = offset + end
+        type_codes = {code: position for position, code in enumerate(EVENT_TYPES)}
+        types, players, dimensions, blocks, positions = [], [], [], [], []
+        for line in raw[:end].decode("utf-8").splitlines():
+            fields = line.split(" ")
+            if len(fields) == 2 and fields[0] == START_CODE:
+                self._starts[segment] = int(fields[1]) / 1000
+                continue
+            if len(fields) != 8 or fields[0] not in type_codes:
+                continue
+            code, uuid, dimension, x, y, z, block, state = fields
+            types.append(type_codes[code])
+            players.append(self._intern(uuid, self._player_codes, self.players))
+            dimensions.append(self._intern(dimension, self._dimension_codes, self.dimensions))
+            block_code = self._block_codes.get((block, state))
+            if block_code is None:
+                block_code = self._block_codes[(block, state)] = len(self.blocks)
+                self.blocks.append((block, _parse_state(state)))
+            blocks.append(block_code)
+            positions.append((float(x), float(y), float(z)))
+        if not types:
+            return 0, reached
+        self.types = np.concatenate((self.types, np.array(types, dtype=np.int8)))
+        self.player_column = np.concatenate((self.player_column, np.array(players, dtype=np.int32)))
+        self.dimension_column = np.concatenate((self.dimension_column, np.array(dimensions, dtype=np.int16)))
+        self.block_column = np.concatenate((self.block_column, np.array(blocks, dtype=np.int32)))
+        self.positions = np.concatenate((self.positions, np.array(positions, dtype=np.float64).reshape(-1, 3)))
+        self.segment_column = np.concatenate((self.segment_column, np.full(len(types), segment, dtype=np.int32)))
+        return len(types), reached
+
+    def area_mask(self, area: Optional[Area]) -> 'np.ndarray':
+        """
+        events where the player stood inside the area, bounds are inclusive like check_player_in_area
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if not area:
+            return mask
+        for column, axis in enumerate(AXES):
+            lo = area.get(axis + "_min")
+            hi = area.get(axis + "_max")
+            if lo is not None:
+                mask &= self.positions[:, column] >= lo
+            if hi is not None:
+                mask &= self.positions[:, column] <= hi
+        return mask
+
+    def dimension_mask(self, dimension: Optional[str]) -> 'np.ndarray':
+        """
+        events in the dimension, all of them for None
+        """
+        if dimension is None:
+            return np.ones(len(self), dtype=bool)
+        code = self._dimension_codes.get(dimension)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.dimension_column == code
+
+    def block_mask(self, block_filter: Optional[Dict[str, Any]]) -> 'np.ndarray':
+        """
+        events whose block passes a compiled filter, evaluated once per distinct block and state
+        """
+        if block_filter is None or block_filter.get("mode") is None:
+            return np.ones(len(self), dtype=bool)
+        passes = np.array([block_filter_matches(block_filter, block, state) for block, state in self.blocks],
+                          dtype=bool)
+        return passes[self.block_column]
+
+
+def count_tracker(journal: EventJournal, tracker: Tracker) -> Dict[str, int]:
+    """
+    What the tracker would have counted for every player with events in the journal, players with no match get 0
+    """
+    tracker_type = list(EVENT_TYPES.values()).index(tracker.type)
+    candidates = (journal.types == tracker_type) & journal.area_mask(tracker.area) & \
+        journal.dimension_mask(tracker.dimension)
+    if tracker.mode == "sum":
+        counted = np.zeros(len(journal), dtype=np.int64)
+    else:
+        counted = np.zeros(len(journal), dtype=bool)
+    for component in tracker.components:
+        matched = candidates & journal.area_mask(component.area) & journal.dimension_mask(component.dimension) & \
+            journal.block_mask(component.block_type.to_script())
+        if tracker.mode == "sum":
+            counted += matched
+        else:
+            counted |= matched
+    totals = np.bincount(journal.player_column, weights=counted, minlength=len(journal.players))
+    # players whose events were all pruned are left as they are
+    present = np.bincount(journal.player_column, minlength=len(journal.players)) > 0
+    return {uuid: int(total) for uuid, total, kept in zip(journal.players, totals, present) if kept}
+
+
+def write_backfill(data_path: str|Path, tracker_id: str, counts: Dict[str, int]) -> Path:
+    """
+    Write the counts where apply_backfill in the script reads them
+    """
+    path = Path(data_path) / "backfill" / f"{tracker_id}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(counts, f)
+    return path
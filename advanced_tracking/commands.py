@@ -1,4 +1,6 @@
+import functools
 import json
+import os
 from typing import Optional, Dict, Callable, List, Tuple, get_args
 
 from mcdreforged.command.builder.tools import SimpleCommandBuilder
@@ -10,34 +12,49 @@ from mcdreforged.command.command_source import CommandSource, PlayerCommandSourc
 from mcdreforged.plugin.si.plugin_server_interface import PluginServerInterface
 from mcdreforged.command.builder.nodes.arguments import Text, QuotableText, Integer, GreedyText
 from mcdreforged.utils.serializer import Serializable
+from mcdreforged.api.decorator import new_thread
 
 from advanced_tracking import ScriptLoader
 from advanced_tracking.config import Config
-from advanced_tracking.project_types import TrackerType, TrackerMode, BlockTypes, BlockTypeMode
+from advanced_tracking.backfill import JournalPrunedError, numpy_available
+from advanced_tracking.utils.perf import recorder, profile_call
+from advanced_tracking.project_types import TrackerType, TrackerMode, BlockTypes, BlockTypeMode, ScoreboardMode
 from advanced_tracking.tracker import Tracker, TrackerRegistry, TrackerComponent
 from advanced_tracking.scoreboard import Scoreboard, ScoreboardRegistry
 from advanced_tracking.utils.command_nodes import MarkingLiteral
 
 from time import time
+from datetime import datetime
 
 CONFIRM_TIME = 60
 
 TRACKER_TYPE_DICT: Dict[str, str] = {
     'player_break_blocks': 'pbb',
     'player_place_blocks': 'ppb',
+    'player_active_time': 'pat',
     'ppb': 'ppb',
-    'pbb': 'pbb'
+    'pbb': 'pbb',
+    'pat': 'pat'
 }
 
 NONE_ALIASES: List[str] = ['None', 'none', 'null', 'no', 'n', 'N', '=', '.']
 
 REMOVE_ALIASES: List[str] = ['remove', 'rm', 'del', 'delete']
 
+# short names of the vanilla dimensions, as player~'dimension' returns them
+DIMENSION_ALIASES: Dict[str, str] = {
+    'nether': 'the_nether',
+    'end': 'the_end',
+    'world': 'overworld'
+}
+
 def reg_flexible_region_selection(parent: AbstractNode,
                                   exec: Callable[[CommandSource, CommandContext], None],
                                   children: Optional[List[AbstractNode]] = None) -> AbstractNode:
     if children is None:
         children = []
+    # optional dimension after the last coordinate
+    children = [Text('dimension').runs(exec), *children]
     for name in ['x1', 'y1', 'z1', 'x2', 'y2', 'z2'][::-1]:
         int_node = Integer(name)
         plus_node = MarkingLiteral('+').set_mark('+', name)
@@ -90,6 +107,19 @@ def parse_area(ctx: CommandContext) -> Dict[str, int]:
     return area
 
 
+def parse_dimension(ctx: CommandContext, default: Optional[str] = None) -> Optional[str]:
+    """
+    The dimension argument, default if it was left out, None for a none alias.
+    """
+    dimension = ctx.get('dimension')
+    if dimension is None:
+        return default
+    if dimension in NONE_ALIASES:
+        return None
+    dimension = dimension.removeprefix('minecraft:')
+    return DIMENSION_ALIASES.get(dimension, dimension)
+
+
 class ConfirmCache(Serializable):
     func: Optional[Callable[[CommandSource, CommandContext], None]] = None
     src: Optional[CommandSource] = None
@@ -206,6 +236,7 @@ class CommandManager:
         Decorator to require confirmation for a command.
         '''
 
+        @functools.wraps(func)
         def wrapper(cmd_manager: Self, src: CommandSource, ctx: CommandContext) -> None:
             src.reply('Please confirm this command by `!!at confirm` within 60 seconds.')
             cmd_manager.confirm_cache.register_confirmable(src, ctx, lambda s, c: func(cmd_manager, s, c))
@@ -289,8 +320,9 @@ class CommandManager:
         tracker: Tracker
         tracker.type = ctx['tracker_type']
         tracker.area = parse_area(ctx)
+        tracker.dimension = parse_dimension(ctx, tracker.dimension)
         tracker.mode = 'union'
-        tracker.components = []
+        tracker.clear_components()
         tracker.comments = ctx.get('comments', '')
         self.script_loader.inject_tracker_data()
         src.reply(f"Tracker '{ctx['tracker_id']}' has been overridden.")
@@ -300,7 +332,8 @@ class CommandManager:
             src.reply(f"Tracker '{ctx['tracker_id']}' already exists. Please use !!at confirm to override.")
             self.override_tracker(src, ctx)
             return
-        tracker = Tracker(id=ctx['tracker_id'], type=tracker_type, area=parse_area(ctx))
+        tracker = Tracker(id=ctx['tracker_id'], type=tracker_type, area=parse_area(ctx), dimension=parse_dimension(ctx),
+                          created=time())
         self.tracker_registry.add(tracker)
         self.script_loader.inject_tracker_data()
 
@@ -310,6 +343,9 @@ class CommandManager:
     def cmd_add_pbb_tracker(self, src: CommandSource, ctx: CommandContext) -> None:
         self.add_tracker(src, ctx, 'player_break_blocks')
 
+    def cmd_add_pat_tracker(self, src: CommandSource, ctx: CommandContext) -> None:
+        self.add_tracker(src, ctx, 'player_active_time')
+
     # endregion
 
     @confirmable
@@ -318,7 +354,8 @@ class CommandManager:
         Remove a tracker by ID.
         """
         tracker_id = ctx['tracker_id']
-        if self.tracker_registry.remove(tracker_id):
+        if self.tracker_registry.remove_tracker(tracker_id):
+            self.script_loader.inject_tracker_data()
             src.reply(f"Tracker '{tracker_id}' has been removed.")
         else:
             src.reply(f"Tracker '{tracker_id}' not found.")
@@ -335,9 +372,9 @@ class CommandManager:
             return
         area = parse_area(ctx)
         tracker.area = area
-        self.tracker_registry.add(tracker)
+        tracker.dimension = parse_dimension(ctx, tracker.dimension)
         self.script_loader.inject_tracker_data()
-        src.reply(f"Tracker '{tracker_id}' area has been updated to {area}.")
+        src.reply(f"Tracker '{tracker_id}' area has been updated to {area} in {tracker.dimension or 'every dimension'}.")
 
     def set_tracker_type(self, src: CommandSource, ctx: CommandContext, tracker_type: TrackerType) -> None:
         """
@@ -351,7 +388,6 @@ class CommandManager:
             src.reply(f"Tracker '{tracker_id}' is already of type '{tracker_type}'.")
             return
         tracker.type = tracker_type
-        self.tracker_registry.add(tracker)
         self.script_loader.inject_tracker_data()
         src.reply(f"Tracker '{tracker_id}' type has been updated to '{tracker_type}'.")
 
@@ -367,6 +403,12 @@ class CommandManager:
         """
         self.set_tracker_type(src, ctx, 'player_break_blocks')
 
+    def cmd_set_tracker_pat(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Set the tracker type to player_active_time.
+        """
+        self.set_tracker_type(src, ctx, 'player_active_time')
+
     def set_tracker_mode(self, src: CommandSource, ctx: CommandContext, mode: TrackerMode) -> None:
         """
         set the mode of an existing tracker.
@@ -408,6 +450,7 @@ class CommandManager:
         component = tracker.get_component(component_id)
         area = parse_area(ctx)
         component.area = area
+        component.dimension = parse_dimension(ctx, component.dimension)
         component.comments = ''
         component.block_type = BlockTypes()
         self.script_loader.inject_tracker_data()
@@ -432,10 +475,15 @@ class CommandManager:
             return
         src.reply('Component not found, creating new one...')
         area = parse_area(ctx)
-        component = TrackerComponent(id=component_id, area=area, comments='', block_type=BlockTypes())
+        dimension = parse_dimension(ctx)
+        component = TrackerComponent(id=component_id, area=area, dimension=dimension, comments='',
+                                     block_type=BlockTypes())
         tracker.add_component(component)
         self.script_loader.inject_tracker_data()
-        src.reply(f"Component '{component_id}' has been added to tracker '{tracker_id}' with area {area}.")
+        src.reply(f"Component '{component_id}' has been added to tracker '{tracker_id}' with area {area}"
+                  + (f" in {dimension}." if dimension is not None else "."))
+        if dimension is not None and tracker.dimension not in (None, dimension):
+            src.reply(f"Tracker '{tracker_id}' only counts in {tracker.dimension}, this component will never match.")
 
     @confirmable
     def cmd_remove_component(self, src: CommandSource, ctx: CommandContext) -> None:
@@ -443,6 +491,8 @@ class CommandManager:
         if component is None:
             return
         tracker.remove_component(component.id)
+        self.script_loader.inject_tracker_data()
+        src.reply(f"Component '{component.id}' has been removed from tracker '{tracker.id}'.")
 
     # region component editing
     def set_component_list_mode(self, src: CommandSource, ctx: CommandContext, mode: BlockTypeMode) -> None:
@@ -499,8 +549,9 @@ class CommandManager:
             return
         block_type = ctx['block_type']
         if block_type not in component.block_type.list:
-            component.block_type.list[block_type] = [{}] # TODO: blockstate support
-        component.block_type.list[block_type].append(ctx['block_data'])
+            component.block_type.list[block_type] = []
+        # an empty requirement matches every state of the block
+        component.block_type.list[block_type].append(ctx.get('block_data', {})) # TODO: blockstate support
         self.script_loader.inject_tracker_data()
 
     # endregion
@@ -529,7 +580,8 @@ class CommandManager:
         if 'tracker_id' in ctx:
             scoreboard.add_tracker(ctx['tracker_id'])
         self.scoreboard_registry.add(scoreboard)
-        self.script_loader.inject_scoreboard_data()
+        # the tracker data holds the scoreboards of each tracker too
+        self.script_loader.inject_data()
 
     def cmd_scoreboard_add_tracker(self, src: CommandSource, ctx: CommandContext) -> None:
         """
@@ -547,7 +599,7 @@ class CommandManager:
             flag = True
         if flag:
             return
-        scoreboard.add_tracker(tracker_id)
+        scoreboard.add_tracker(tracker_id, ctx.get('weight', 1))
         self.script_loader.inject_data()
         src.reply(f"Tracker '{tracker_id}' has been added to scoreboard '{scoreboard_id}'.")
 
@@ -558,17 +610,261 @@ class CommandManager:
         """
         scoreboard_id = ctx['scoreboard_id']
         if self.scoreboard_registry.remove(scoreboard_id):
+            self.script_loader.inject_data()
             src.reply(f"Scoreboard '{scoreboard_id}' has been removed.")
         else:
             src.reply(f"Scoreboard '{scoreboard_id}' not found.")
+
+    def cmd_set_scoreboard_mode(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Set how the scoreboard combines the counts of its trackers.
+        """
+        scoreboard = self.scoreboard_registry.get_scoreboard(ctx['scoreboard_id'])
+        if scoreboard is None:
+            src.reply(f"Scoreboard '{ctx['scoreboard_id']}' not found.")
+            return
+        mode = ctx['mode']
+        if mode not in get_args(ScoreboardMode):
+            src.reply(f"Unknown mode '{mode}', available modes: {', '.join(get_args(ScoreboardMode))}.")
+            return
+        scoreboard.mode = mode
+        self.script_loader.inject_data()
+        src.reply(f"Scoreboard '{scoreboard.id}' mode has been updated to '{mode}', "
+                  f"use `!!at scoreboard {scoreboard.id} rebuild` to update offline players.")
+
+    def cmd_set_scoreboard_cap(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Set the largest contribution of a single tracker in capped_sum mode, none removes the cap.
+        """
+        scoreboard = self.scoreboard_registry.get_scoreboard(ctx['scoreboard_id'])
+        if scoreboard is None:
+            src.reply(f"Scoreboard '{ctx['scoreboard_id']}' not found.")
+            return
+        scoreboard.cap = ctx.get('cap')
+        self.script_loader.inject_data()
+        src.reply(f"Scoreboard '{scoreboard.id}' cap has been updated to {scoreboard.cap}.")
+        if scoreboard.mode != 'capped_sum':
+            src.reply(f"The cap is only used in capped_sum mode, the scoreboard is in '{scoreboard.mode}' mode.")
+
+    def cmd_rebuild_scoreboard(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Recompute a scoreboard for every player with stored data, including the offline ones.
+        """
+        scoreboard = self.scoreboard_registry.get_scoreboard(ctx['scoreboard_id'])
+        if scoreboard is None:
+            src.reply(f"Scoreboard '{ctx['scoreboard_id']}' not found.")
+            return
+        if scoreboard.score({}) is None:
+            src.reply(f"Scoreboards in mode '{scoreboard.mode}' can't be rebuilt.")
+            return
+        src.reply(f"Rebuilding scoreboard '{scoreboard.id}'...")
+        # a copy, the registry may be edited while the rebuild runs
+        self._run_rebuild(src, Scoreboard.deserialize(scoreboard.serialize()))
+
+    @new_thread('AdvancedTracking rebuild')
+    def _run_rebuild(self, src: CommandSource, scoreboard: Scoreboard) -> None:
+        # the script has to know the scoreboard as it is now
+        self.script_loader.wait_for_injections()
+        start = time()
+        players = self.script_loader.rebuild_scoreboard(scoreboard)
+        src.reply(f"Scoreboard '{scoreboard.id}' has been rebuilt for {players} players in {time() - start:.2f}s.")
     # endregion
 
     def cmd_reload_scripts(self, src: CommandSource, ctx: CommandContext) -> None:
         """
-        Reload the scripts.
+        Reload the script and all its data, whether they changed or not.
         """
-        self.script_loader.inject_tracker_data()
-        src.reply('Scripts have been reloaded.')
+        self.script_loader.inject_all(force=True)
+        src.reply('Script reload requested, it will load every data file again.')
+
+    # region batch commands
+    def cmd_batch_status(self, src: CommandSource, ctx: CommandContext) -> None:
+        if self.script_loader.has_batch():
+            src.reply('A batch is in progress, use `!!at batch commit` to apply it or `!!at batch abort` to discard it.')
+        else:
+            src.reply('No batch in progress, use `!!at batch begin` to start one.')
+
+    def cmd_batch_begin(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Start a batch, edits are only applied to the server when it is committed.
+        """
+        if self.script_loader.has_batch():
+            src.reply('A batch is already in progress.')
+            return
+        self.script_loader.begin_batch()
+        src.reply('Batch started, edits will be applied on `!!at batch commit`.')
+
+    def cmd_batch_commit(self, src: CommandSource, ctx: CommandContext) -> None:
+        if not self.script_loader.has_batch():
+            src.reply('No batch in progress.')
+            return
+        self.script_loader.commit_batch()
+        src.reply('Batch committed.')
+
+    @confirmable
+    def cmd_batch_abort(self, src: CommandSource, ctx: CommandContext) -> None:
+        if not self.script_loader.has_batch():
+            src.reply('No batch in progress.')
+            return
+        self.script_loader.abort_batch()
+        src.reply('Batch aborted, all edits since `!!at batch begin` have been discarded.')
+    # endregion
+
+    def cmd_flush_data(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Force the script to write all buffered player data.
+        """
+        self.script_loader.flush_data()
+        src.reply('Tracking data has been flushed.')
+
+    # region backfill
+    @confirmable
+    def cmd_backfill_tracker(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Recount a tracker over all journaled block events, replacing its current counts.
+        Refused if the journal was pruned after the tracker was added.
+        """
+        tracker = self.tracker_registry.get_tracker(ctx['tracker_id'])
+        if tracker is None:
+            src.reply(f"Tracker '{ctx['tracker_id']}' not found.")
+            return
+        if not tracker.counts_blocks:
+            src.reply(f"Tracker '{tracker.id}' counts time, only block trackers can be backfilled.")
+            return
+        if not numpy_available():
+            src.reply('Backfilling needs numpy, install it with `pip install numpy`.')
+            return
+        src.reply(f"Backfilling tracker '{tracker.id}'...")
+        # a copy, the registry may be edited while the backfill runs
+        self._run_backfill(src, Tracker.deserialize(tracker.serialize()))
+
+    @new_thread('AdvancedTracking backfill')
+    def _run_backfill(self, src: CommandSource, tracker: Tracker) -> None:
+        # events counted live from the journal marker on have to be counted by the tracker as it is now
+        self.script_loader.wait_for_injections()
+        start = time()
+        try:
+            counts = self.script_loader.backfill_tracker(tracker)
+        except JournalPrunedError as e:
+            since = 'an unknown time' if e.start is None else \
+                datetime.fromtimestamp(e.start).strftime('%Y-%m-%d %H:%M:%S')
+            src.reply(f"Tracker '{tracker.id}' has not been backfilled, the journal only covers the events since "
+                      f"{since}, older ones were pruned after the tracker was added and its counts would lose them.")
+            return
+        if counts is None:
+            src.reply(f"Backfilling tracker '{tracker.id}' failed, the script didn't flush the journal in time.")
+            return
+        src.reply(f"Tracker '{tracker.id}' has been backfilled for {len(counts)} players "
+                  f"({sum(counts.values())} counts) in {time() - start:.2f}s.")
+    # endregion
+
+    # region stats
+    def cmd_show_stats(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Show the hottest and most expensive trackers from the counters the script collects.
+        """
+        if not self.config.collect_stats:
+            src.reply('Statistics are not being collected, enable them with `!!at stats on`.')
+        stats = self.script_loader.read_stats()
+        if stats is None:
+            src.reply('No statistics have been dumped by the script yet.')
+            return
+        count = ctx.get('count', 5)
+        src.reply(f'Statistics as of tick {stats.tick}:')
+        for tracker_type, events in stats.events.items():
+            line = f"- {tracker_type}: {events.get('events', 0)} events"
+            average = stats.average_time(tracker_type)
+            if average is not None:
+                line += f", {average:.3f} ms on average over {events['timed']} sampled"
+            src.reply(line)
+        src.reply('Hottest trackers:')
+        for tracker in stats.hottest(count):
+            src.reply(f'- {tracker.id}: {tracker.matches} matches in {tracker.checks} checks ({tracker.hit_rate:.1%})')
+        src.reply('Most expensive trackers:')
+        for tracker in stats.most_expensive(count):
+            src.reply(f"- {tracker.id}: cost {tracker.cost} ({tracker.checks} checks, "
+                      f"{tracker.area_rejects} rejected by area, "
+                      f"{tracker.component_total('checks')} component checks, "
+                      f"{tracker.component_total('block_rejects')} rejected by block filter)")
+
+    def set_collect_stats(self, src: CommandSource, enabled: bool) -> None:
+        self.config.collect_stats = enabled
+        # settings, and the compiled script which is instrumented or not
+        self.script_loader.inject_all()
+        src.reply(f"Statistics collection is now {'on' if enabled else 'off'}.")
+
+    def cmd_stats_on(self, src: CommandSource, ctx: CommandContext) -> None:
+        self.set_collect_stats(src, True)
+
+    def cmd_stats_off(self, src: CommandSource, ctx: CommandContext) -> None:
+        self.set_collect_stats(src, False)
+
+    def cmd_reset_stats(self, src: CommandSource, ctx: CommandContext) -> None:
+        self.script_loader.reset_stats()
+        src.reply('Statistics have been reset.')
+    # endregion
+
+    # region perf
+    def _wrap_command(self, callback: Callable[[CommandSource, CommandContext], None]) \
+            -> Callable[[CommandSource, CommandContext], None]:
+        '''
+        Wrap a command callback: its duration is recorded for `!!at perf`, it doesn't edit the registries
+        while they are being injected, and the injections it requests are reported back to the source.
+        '''
+        name = f'command {callback.__name__}'
+
+        def wrapper(src: CommandSource, ctx: CommandContext) -> None:
+            with recorder.timed(name), self.script_loader.lock, self.script_loader.requested_by(src), \
+                    self.script_loader.edits_by():
+                callback(src, ctx)
+
+        return wrapper
+
+    def cmd_show_perf(self, src: CommandSource, ctx: CommandContext) -> None:
+        lines = recorder.report()
+        if not lines:
+            src.reply('Nothing has been recorded yet.')
+            return
+        for line in lines:
+            src.reply(line)
+
+    def cmd_reset_perf(self, src: CommandSource, ctx: CommandContext) -> None:
+        recorder.reset()
+        src.reply('Performance records have been reset.')
+
+    def cmd_profile_command(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Run one `!!at` command under cProfile, the raw stats are saved in the plugin's data folder.
+        The injections it requests are applied within the profiled call instead of by the background worker.
+        """
+        command = '!!at ' + ctx['profiled_command']
+        output = os.path.join(self.server.get_data_folder(), f'profile_{int(time())}.prof')
+        # earlier edits are not part of the profile
+        self.script_loader.wait_for_injections()
+
+        def run_inline() -> None:
+            with self.script_loader.inline_injections():
+                self.server.execute_command(command, src)
+
+        report = profile_call(run_inline, output=output)
+        for line in report.strip().splitlines():
+            src.reply(line)
+        src.reply(f'Profile saved to {output}')
+    # endregion
+
+    def cmd_show_flush_interval(self, src: CommandSource, ctx: CommandContext) -> None:
+        src.reply(f'Tracking data is flushed every {self.config.flush_interval} ticks.')
+
+    def cmd_set_flush_interval(self, src: CommandSource, ctx: CommandContext) -> None:
+        """
+        Set how many ticks the script buffers player data before writing it, 0 writes on every event.
+        """
+        self.config.flush_interval = ctx['ticks']
+        self.script_loader.inject_settings()
+        if ctx['ticks'] <= 0:
+            src.reply('Tracking data will be written on every counted event.')
+        else:
+            src.reply(f"Tracking data will be flushed every {ctx['ticks']} ticks.")
 
     def cmd_show_config(self, src: CommandSource, ctx: CommandContext) -> None:
         src.reply(json.dumps(self.config.serialize(), indent=4, sort_keys=True))
@@ -584,32 +880,59 @@ class CommandManager:
 
     def register_commands(self) -> None:
 
-        root = Literal('!!at').runs(self.cmd_help)
+        root = Literal('!!at').runs(self._wrap_command(self.cmd_help))
 
         builder = SimpleCommandBuilder()
 
-        builder.command('help', self.cmd_help)
-        builder.command('help <command>', self.cmd_help)
+        builder.command('help', self._wrap_command(self.cmd_help))
+        builder.command('help <command>', self._wrap_command(self.cmd_help))
 
         builder.arg('command', Text)
 
 
-        builder.command('reset_all', self.cmd_reset_all)
-        builder.command('confirm', self.cmd_confirm)
+        builder.command('reset_all', self._wrap_command(self.cmd_reset_all))
+        builder.command('confirm', self._wrap_command(self.cmd_confirm))
+        builder.command('reload', self._wrap_command(self.cmd_reload_scripts))
 
         # List commands
-        builder.command('list tracker', self.cmd_list_trackers)
-        builder.command('list trackers', self.cmd_list_trackers)
-        builder.command('list scoreboard', self.cmd_list_scoreboards)
-        builder.command('list scoreboards', self.cmd_list_scoreboards)
+        builder.command('list tracker', self._wrap_command(self.cmd_list_trackers))
+        builder.command('list trackers', self._wrap_command(self.cmd_list_trackers))
+        builder.command('list scoreboard', self._wrap_command(self.cmd_list_scoreboards))
+        builder.command('list scoreboards', self._wrap_command(self.cmd_list_scoreboards))
 
         # show commands
-        builder.command('show tracker <tracker_id>', self.cmd_show_tracker)
-        builder.command('show component <tracker_id> <component_id>', self.cmd_show_component)
-        builder.command('show scoreboard <scoreboard_id>', self.cmd_show_scoreboard)
-        builder.command('showraw tracker', self.cmd_showraw_tracker)
-        builder.command('showraw scoreboard', self.cmd_showraw_scoreboard)
-        builder.command('showraw all', self.cmd_show_config)
+        builder.command('show tracker <tracker_id>', self._wrap_command(self.cmd_show_tracker))
+        builder.command('show component <tracker_id> <component_id>', self._wrap_command(self.cmd_show_component))
+        builder.command('show scoreboard <scoreboard_id>', self._wrap_command(self.cmd_show_scoreboard))
+        builder.command('showraw tracker', self._wrap_command(self.cmd_showraw_tracker))
+        builder.command('showraw scoreboard', self._wrap_command(self.cmd_showraw_scoreboard))
+        builder.command('showraw all', self._wrap_command(self.cmd_show_config))
+
+        # batch editing
+        builder.command('batch', self._wrap_command(self.cmd_batch_status))
+        builder.command('batch begin', self._wrap_command(self.cmd_batch_begin))
+        builder.command('batch commit', self._wrap_command(self.cmd_batch_commit))
+        builder.command('batch abort', self._wrap_command(self.cmd_batch_abort))
+
+        # buffered data
+        builder.command('flush', self._wrap_command(self.cmd_flush_data))
+        builder.command('flush interval', self._wrap_command(self.cmd_show_flush_interval))
+        builder.command('flush interval <ticks>', self._wrap_command(self.cmd_set_flush_interval))
+        builder.arg('ticks', Integer)
+
+        # statistics
+        builder.command('stats', self._wrap_command(self.cmd_show_stats))
+        builder.command('stats <count>', self._wrap_command(self.cmd_show_stats))
+        builder.command('stats on', self._wrap_command(self.cmd_stats_on))
+        builder.command('stats off', self._wrap_command(self.cmd_stats_off))
+        builder.command('stats reset', self._wrap_command(self.cmd_reset_stats))
+        builder.arg('count', Integer)
+
+        # python side timings
+        builder.command('perf', self._wrap_command(self.cmd_show_perf))
+        builder.command('perf reset', self._wrap_command(self.cmd_reset_perf))
+        builder.command('perf profile <profiled_command>', self.cmd_profile_command)
+        builder.arg('profiled_command', GreedyText)
 
         builder.arg('tracker_id', Text)
         builder.arg('component_id', Text)
@@ -617,9 +940,9 @@ class CommandManager:
 
         # remove
         for alias in REMOVE_ALIASES:
-            builder.command(f'{alias} tracker <tracker_id>', self.cmd_remove_tracker)
-            builder.command(f'{alias} component <tracker_id> <component_id>', self.cmd_remove_component)
-            # builder.command(f'{alias} scoreboard <scoreboard_id>', self.cmd_remove_scoreboard)
+            builder.command(f'{alias} tracker <tracker_id>', self._wrap_command(self.cmd_remove_tracker))
+            builder.command(f'{alias} component <tracker_id> <component_id>', self._wrap_command(self.cmd_remove_component))
+            # builder.command(f'{alias} scoreboard <scoreboard_id>', self._wrap_command(self.cmd_remove_scoreboard))
 
 
         # builder.print_tree(print)
@@ -627,17 +950,19 @@ class CommandManager:
 
         # region add
         # tracker creation commands
-        pbb_subtree = reg_flexible_region_selection(Literal('player_break_blocks'), self.cmd_add_pbb_tracker)
-        ppb_subtree = reg_flexible_region_selection(Literal('player_place_blocks'), self.cmd_add_ppb_tracker)
+        pbb_subtree = reg_flexible_region_selection(Literal('player_break_blocks'), self._wrap_command(self.cmd_add_pbb_tracker))
+        ppb_subtree = reg_flexible_region_selection(Literal('player_place_blocks'), self._wrap_command(self.cmd_add_ppb_tracker))
+        pat_subtree = reg_flexible_region_selection(Literal('player_active_time'), self._wrap_command(self.cmd_add_pat_tracker))
 
         create_tracker_tree = (Text('tracker_id').then(pbb_subtree).then(Literal('pbb').redirects(pbb_subtree))
-                               .then(ppb_subtree).then(Literal('ppb').redirects(ppb_subtree)))
+                               .then(ppb_subtree).then(Literal('ppb').redirects(ppb_subtree))
+                               .then(pat_subtree).then(Literal('pat').redirects(pat_subtree)))
 
-        create_scoreboard_tree = (Text('scoreboard_id').runs(self.cmd_add_scoreboard)
-                                  .then(QuotableText('display_name').runs(self.cmd_add_scoreboard)))
+        create_scoreboard_tree = (Text('scoreboard_id').runs(self._wrap_command(self.cmd_add_scoreboard))
+                                  .then(QuotableText('display_name').runs(self._wrap_command(self.cmd_add_scoreboard))))
 
         create_component_tree = Text('tracker_id').then(
-            reg_flexible_region_selection(Text('component_id'), self.cmd_add_component))
+            reg_flexible_region_selection(Text('component_id'), self._wrap_command(self.cmd_add_component)))
 
         add_tree = (Literal('add')
                     .then(Literal('tracker').then(create_tracker_tree))
@@ -647,11 +972,12 @@ class CommandManager:
         # endregion
 
         # region tracker subtree
-        tree_end = Text('tracker_id').runs(self.cmd_show_tracker)
+        tree_end = Text('tracker_id').runs(self._wrap_command(self.cmd_show_tracker))
         for alias in REMOVE_ALIASES:
-            tree_end = tree_end.then(Literal(alias).runs(self.cmd_remove_tracker)
-                                     .then(Text('component_id').runs(self.cmd_remove_component)))
+            tree_end = tree_end.then(Literal(alias).runs(self._wrap_command(self.cmd_remove_tracker))
+                                     .then(Text('component_id').runs(self._wrap_command(self.cmd_remove_component))))
         tree_end = tree_end.then(Literal('add').then(Text('component_id').redirects(create_component_tree))) # FIXME
+        tree_end = tree_end.then(Literal('backfill').runs(self._wrap_command(self.cmd_backfill_tracker)))
 
 
         tree_head = Literal('tracker').then(tree_end)
@@ -659,28 +985,34 @@ class CommandManager:
         # endregion
 
         # region component subtree
-        tree_end = Text('component_id').runs(self.cmd_show_tracker)
+        tree_end = Text('component_id').runs(self._wrap_command(self.cmd_show_tracker))
         for alias in REMOVE_ALIASES:
-            tree_end = tree_end.then(Literal(alias).runs(self.cmd_remove_component))
+            tree_end = tree_end.then(Literal(alias).runs(self._wrap_command(self.cmd_remove_component)))
         tree_end = tree_end.then(Literal('add').redirects(create_component_tree))
-        tree_end = tree_end.then(Literal('blacklist').runs(self.cmd_set_component_blacklist))
-        tree_end = tree_end.then(Literal('whitelist').runs(self.cmd_set_component_whitelist))
+        tree_end = tree_end.then(Literal('blacklist').runs(self._wrap_command(self.cmd_set_component_blacklist)))
+        tree_end = tree_end.then(Literal('whitelist').runs(self._wrap_command(self.cmd_set_component_whitelist)))
         # list stuff
         tree_end = tree_end.then(Literal('list').then(Literal('set').then(GreedyText('list').runs(
-            self.cmd_overwrite_block_list))))
+            self._wrap_command(self.cmd_overwrite_block_list)))))
         tree_end = tree_end.then(Literal('set').then(Literal('list').then(GreedyText('list').runs(
-            self.cmd_overwrite_block_list))))
+            self._wrap_command(self.cmd_overwrite_block_list)))))
         tree_end = tree_end.then(Literal('list').then(Literal('add').then(GreedyText('block_type').runs(
-            self.cmd_add_block_type_to_list))))
+            self._wrap_command(self.cmd_add_block_type_to_list)))))
 
         tree_head = Literal('component').then(Text('tracker_id').then(tree_end))
         root.then(tree_head)
         # endregion
 
         # region scoreboard subtree
-        tree_end = Text('scoreboard_id').runs(self.cmd_show_scoreboard)
-        tree_end = tree_end.then(Literal('add').then(Text('tracker_id').runs(self.cmd_scoreboard_add_tracker)
-                                                     .then(Integer('weight').runs(self.cmd_scoreboard_add_tracker))))
+        tree_end = Text('scoreboard_id').runs(self._wrap_command(self.cmd_show_scoreboard))
+        tree_end = tree_end.then(Literal('add').then(Text('tracker_id').runs(self._wrap_command(self.cmd_scoreboard_add_tracker))
+                                                     .then(Integer('weight').runs(self._wrap_command(self.cmd_scoreboard_add_tracker)))))
+        tree_end = tree_end.then(Literal('rebuild').runs(self._wrap_command(self.cmd_rebuild_scoreboard)))
+        tree_end = tree_end.then(Literal('mode').then(Text('mode').runs(self._wrap_command(self.cmd_set_scoreboard_mode))))
+        cap_node = Literal('cap').then(Integer('cap').runs(self._wrap_command(self.cmd_set_scoreboard_cap)))
+        for alias in NONE_ALIASES:
+            cap_node.then(Literal(alias).runs(self._wrap_command(self.cmd_set_scoreboard_cap)))
+        tree_end = tree_end.then(cap_node)
 
 
         tree_head = Literal('scoreboard').then(tree_end)
@@ -13,6 +13,28 @@ class PermissionConfig(Serializable):
 class Config(Serializable):
     scoreboard_registry: ScoreboardRegistry = ScoreboardRegistry()
     tracker_registry: TrackerRegistry= TrackerRegistry()
+    # ticks between two writes of the buffered player data, 0 or less writes on every counted event
+    flush_interval: int = 100
+    # write the script-facing json without whitespace, default fields and repeated block lists
+    compact_script_data: bool = True
+    # append every block event to a journal, used to backfill new or edited trackers
+    journal_events: bool = True
+    # the journal is split into segments of this many events, only the last journal_max_segments are kept
+    journal_segment_events: int = 100000
+    journal_max_segments: int = 10
+    # deploy the trackers compiled into the script instead of the generic script reading trackers.json
+    compile_trackers: bool = True
+    # count checks, matches and rejects per group, tracker and component in the script, see `!!at stats`
+    collect_stats: bool = False
+    # edits within this many ms of each other are injected together by a background worker, 0 or less injects inline
+    injection_delay_ms: int = 200
+    # `!!at scoreboard <id> rebuild` sends at most this many players per command, one command every interval
+    rebuild_batch_size: int = 500
+    rebuild_batch_interval_ms: int = 100
+    # ticks between two samples of the online players for player_active_time trackers
+    active_time_interval: int = 20
+    # players who haven't moved or turned for this many ticks stop being credited with active time
+    afk_timeout: int = 3600
     @classmethod
     @functools.lru_cache
     def __get_default(cls) -> Self:
@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, TYPE_CHECKING, get_args
+
+from advanced_tracking.area import Area, axis_bounds, bounding_box, horizontal_gap
+from advanced_tracking.project_types import TrackerType, ANY_DIMENSION
+
+if TYPE_CHECKING:
+    from advanced_tracking.tracker import Tracker
+
+# trackers whose areas are at most this many blocks apart (on x/z) end up in the same group
+GROUP_DISTANCE = 64
+
+UNBOUNDED_GROUP_ID = "unbounded"
+
+
+class TrackerGroup:
+    '''
+    a group of nearby trackers of the same type, the script skips the whole group if the player is outside its area
+    '''
+    def __init__(self, id: str, area: Area, trackers: List['Tracker']):
+        self.id: str = id
+        self.area: Area = area
+        self.trackers: List['Tracker'] = trackers
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _cluster(areas: List[Area]) -> List[List[int]]:
+    '''
+    single-linkage clustering of bounded areas by horizontal distance, returns lists of indices
+    '''
+    parent = list(range(len(areas)))
+    # sweep along x, only areas whose x ranges are close enough can be linked
+    order = sorted(range(len(areas)), key=lambda i: axis_bounds(areas[i], 'x')[0])
+    active: List[int] = []
+    for i in order:
+        x_min = axis_bounds(areas[i], 'x')[0]
+        active = [j for j in active if axis_bounds(areas[j], 'x')[1] + GROUP_DISTANCE >= x_min]
+        for j in active:
+            if horizontal_gap(areas[i], areas[j]) <= GROUP_DISTANCE:
+                parent[_find(parent, i)] = _find(parent, j)
+        active.append(i)
+    clusters: Dict[int, List[int]] = {}
+    for i in order:
+        clusters.setdefault(_find(parent, i), []).append(i)
+    return list(clusters.values())
+
+
+def plan_groups(trackers: List['Tracker'], group_prefix: str = "") -> Dict[str, Dict[str, TrackerGroup]]:
+    '''
+    split the trackers of every type into groups of spatially close trackers
+
+    trackers open on x or z share a single "unbounded" group, trackers that can never match are left out
+    group ids start with group_prefix, so they stay unique across dimension partitions, and are named after their
+    smallest tracker id, so a group keeps its id as long as its smallest tracker stays in it. adding or removing a
+    tracker can still merge or split clusters, and every group whose smallest tracker id changes that way is renamed
+    '''
+    plan: Dict[str, Dict[str, TrackerGroup]] = {tracker_type: {} for tracker_type in get_args(TrackerType)}
+    for tracker_type in plan:
+        bounded: List['Tracker'] = []
+        bounded_areas: List[Area] = []
+        unbounded: List['Tracker'] = []
+        unbounded_areas: List[Area] = []
+        for tracker in trackers:
+            if tracker.type != tracker_type:
+                continue
+            area: Optional[Area] = tracker.effective_area()
+            if area is None:
+                continue
+            if horizontal_gap(area, area) is None:
+                unbounded.append(tracker)
+                unbounded_areas.append(area)
+            else:
+                bounded.append(tracker)
+                bounded_areas.append(area)
+
+        for cluster in _cluster(bounded_areas):
+            group_id = f"{group_prefix}group_{min(bounded[i].id for i in cluster)}"
+            plan[tracker_type][group_id] = TrackerGroup(
+                id=group_id,
+                area=bounding_box(bounded_areas[i] for i in cluster),
+                trackers=[bounded[i] for i in cluster]
+            )
+        if unbounded:
+            plan[tracker_type][group_prefix + UNBOUNDED_GROUP_ID] = TrackerGroup(
+                id=group_prefix + UNBOUNDED_GROUP_ID,
+                area=bounding_box(unbounded_areas),
+                trackers=unbounded
+            )
+    return plan
+
+
+def plan_partitions(trackers: List['Tracker']) -> Dict[str, Dict[str, Dict[str, TrackerGroup]]]:
+    '''
+    plan_groups for every dimension partition of every type: tracker type -> dimension -> group id -> group
+
+    a type gets a partition for each dimension its trackers or components are restricted to, holding everything
+    that can match there, and an ANY_DIMENSION one with what matches in every dimension, which the script uses
+    for the other dimensions. Empty partitions are left out
+    '''
+    plan: Dict[str, Dict[str, Dict[str, TrackerGroup]]] = {tracker_type: {} for tracker_type in get_args(TrackerType)}
+    for tracker_type in plan:
+        of_type = [tracker for tracker in trackers if tracker.type == tracker_type]
+        dimensions = sorted({dimension for tracker in of_type for dimension in tracker.dimensions()})
+        for dimension in dimensions + [ANY_DIMENSION]:
+            views = [view for tracker in of_type if (view := tracker.for_dimension(dimension)) is not None]
+            prefix = "" if dimension == ANY_DIMENSION else f"{dimension}."
+            groups = plan_groups(views, prefix)[tracker_type]
+            if groups:
+                plan[tracker_type][dimension] = groups
+    return plan
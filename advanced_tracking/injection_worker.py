@@ -0,0 +1,85 @@
+import threading
+from time import monotonic
+from typing import Callable, List, Optional, Set
+
+from mcdreforged.command.command_source import CommandSource
+from mcdreforged.plugin.si.server_interface import ServerInterface
+
+# a request is applied at most this many debounce delays after the first one of a burst
+MAX_DELAYS = 10
+
+
+class InjectionWorker:
+    """
+    Background thread applying injection requests.
+    Requests arriving within the debounce delay of each other are merged and applied in one run,
+    and every command source that asked for one of them is told how it went.
+    """
+    def __init__(self, server: ServerInterface, run: Callable[[Set[str]], None]):
+        self.server: ServerInterface = server
+        self._run_injections: Callable[[Set[str]], None] = run
+        self._condition = threading.Condition()
+        self._pending: Set[str] = set()
+        self._sources: List[CommandSource] = []
+        self._deadline: float = 0
+        self._first_request: float = 0
+        self._running: bool = False
+        self._stopped: bool = False
+        self._thread = threading.Thread(target=self._loop, name="AdvancedTracking injection", daemon=True)
+        self._thread.start()
+
+    def request(self, injection: str, src: Optional[CommandSource], delay: float) -> None:
+        with self._condition:
+            now = monotonic()
+            if not self._pending:
+                self._first_request = now
+            self._pending.add(injection)
+            if src is not None and not any(source is src for source in self._sources):
+                self._sources.append(src)
+            # wait for the burst to end, but not forever
+            self._deadline = min(now + delay, self._first_request + delay * MAX_DELAYS)
+            self._condition.notify_all()
+
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                while not self._stopped and (remaining := self._deadline - monotonic()) > 0:
+                    self._condition.wait(remaining)
+                pending, self._pending = self._pending, set()
+                sources, self._sources = self._sources, []
+                self._running = True
+            try:
+                self._run_injections(pending)
+            except Exception as e:
+                self.server.logger.exception("Failed to inject tracking data")
+                for src in sources:
+                    src.reply(f"Failed to apply the changes to the server: {e}")
+            else:
+                for src in sources:
+                    src.reply("Changes have been applied to the server.")
+            finally:
+                with self._condition:
+                    self._running = False
+                    self._condition.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every request so far has been applied, returns False on timeout.
+        """
+        with self._condition:
+            self._deadline = 0
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def stop(self) -> None:
+        """
+        Apply what is still pending right away, then end the thread.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
@@ -1,14 +1,73 @@
-from typing import Dict, List, Literal
+from typing import Any, Dict, List, Literal
 from mcdreforged.api.all import Serializable
 
 TrackerMode = Literal["union", "sum"]
 BlockTypeMode = Literal["whitelist", "blacklist", None]
-TrackerType = Literal["player_break_blocks", "player_place_blocks"]
+TrackerType = Literal["player_break_blocks", "player_place_blocks", "player_active_time"]
+# partition of the script data holding the trackers for every dimension that has no partition of its own
+ANY_DIMENSION = "*"
+# tracker types counting ticks spent in their area, sampled by the script, instead of block events
+TIME_TRACKER_TYPES = ("player_active_time",)
+# weighted_sum: sum of weight * count over the trackers, average: that sum divided by the total weight (rounded down),
+# max/min: the largest/smallest weight * count, capped_sum: the sum with every tracker contributing at most the cap
+ScoreboardMode = Literal["weighted_sum", "max", "min", "average", "capped_sum"]
+
+def _state_value(value: str|bool|int) -> str:
+    # the script compares the string form of block_state(), e.g. 'true' or '3'
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
 
 class BlockTypes(Serializable):
     mode:BlockTypeMode = None
     list:Dict[str, List[Dict[str, str|bool|int]]] = {}
 
+    def to_script(self, compact: bool = False) -> Dict[str, Any]:
+        '''
+        compile the filter into the form the carpet script checks against
+
+        blocks matching regardless of their state go to the "names" set, the rest keep their
+        requirements, minus duplicated or subsumed ones, and the state keys they need to query
+
+        in compact form, empty fields are left out
+        '''
+        if self.mode is None:
+            return {} if compact else {"mode": None}
+        names: Dict[str, bool] = {}
+        states: Dict[str, Dict[str, Any]] = {}
+        for block, requirements in self.list.items():
+            block = block.removeprefix("minecraft:")
+            normalized = {tuple(sorted((key, _state_value(value)) for key, value in requirement.items()))
+                          for requirement in requirements}
+            if block in names:
+                continue
+            if block in states:
+                normalized |= {tuple(sorted(requirement.items())) for requirement in states[block]["requirements"]}
+            if () in normalized:
+                # an empty requirement matches any state
+                names[block] = True
+                states.pop(block, None)
+                continue
+            # drop requirements that are stricter than another one of the same block
+            kept = [requirement for requirement in normalized
+                    if not any(other != requirement and set(other) <= set(requirement) for other in normalized)]
+            if not kept:
+                continue
+            kept.sort()
+            states[block] = {
+                "keys": sorted({key for requirement in kept for key, _ in requirement}),
+                "requirements": [dict(requirement) for requirement in kept]
+            }
+        if compact:
+            data: Dict[str, Any] = {"mode": self.mode}
+            if names:
+                data["names"] = names
+            if states:
+                data["states"] = states
+            return data
+        return {"mode": self.mode, "names": names, "states": states}
+
 
 if __name__ == "__main__":
     blockTypes = BlockTypes(
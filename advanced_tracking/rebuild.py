@@ -0,0 +1,66 @@
+"""
+Recomputation of a scoreboard for every player with stored data, online or not
+
+The script only updates the score of a player when they count something, so after a scoreboard is created or its
+weights change the scores of everyone else are stale. The player files in tracked_data/ are read one at a time,
+and the scores are sent to the script in batches small enough to run within a tick.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from advanced_tracking.scoreboard import Scoreboard
+from advanced_tracking.utils.script_compiler import to_scarpet
+
+
+def iter_player_data(data_path: Path) -> Iterator[Tuple[str, Dict]]:
+    '''
+    (uuid, data) of every readable player file in tracked_data/, without listing them all first
+    '''
+    try:
+        entries = os.scandir(data_path / "tracked_data")
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(data, dict):
+                yield entry.name[:-len(".json")], data
+
+
+def compute_scores(data_path: Path, scoreboard: Scoreboard) -> Iterator[Tuple[str, int]]:
+    '''
+    (player name, score) of every player with stored counts
+    '''
+    for _, data in iter_player_data(data_path):
+        name = data.get("player_ID")
+        counts = data.get("trackers")
+        if not isinstance(name, str) or not isinstance(counts, dict):
+            continue
+        score = scoreboard.score(counts)
+        if score is not None:
+            yield name, score
+
+
+def score_batches(scores: Iterator[Tuple[str, int]], batch_size: int, max_length: int) -> Iterator[Dict[str, int]]:
+    '''
+    the scores grouped into maps of at most batch_size players, each at most max_length long as a scarpet literal
+    '''
+    batch: Dict[str, int] = {}
+    length = 2
+    for name, score in scores:
+        entry_length = len(to_scarpet(name)) + len(str(score)) + 6
+        if batch and (len(batch) >= batch_size or length + entry_length > max_length):
+            yield batch
+            batch, length = {}, 2
+        batch[name] = score
+        length += entry_length
+    if batch:
+        yield batch
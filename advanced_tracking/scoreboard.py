@@ -1,11 +1,35 @@
 import json
 from pathlib import Path
-from typing import List, Dict, Optional, Type
+from typing import List, Dict, Optional, Type, Tuple
 
 from mcdreforged.command.command_source import CommandSource
 from mcdreforged.utils.serializer import Serializable
 from typing_extensions import Self
 from advanced_tracking.tracker import Tracker
+from advanced_tracking.project_types import ScoreboardMode
+from advanced_tracking.utils.indexed_list import positions_of, swap_remove
+
+
+def compute_score(mode: str, trackers: List[Tuple[str, int]], counts: Dict[str, int],
+                  cap: Optional[int] = None) -> Optional[int]:
+    '''
+    the score of a player from their counts, trackers being (tracker id, weight) pairs without repeated ids
+
+    the same as scoreboard_state in the script, None if the mode is unknown
+    '''
+    values = [counts.get(tracker_id, 0) * weight for tracker_id, weight in trackers]
+    if mode == "weighted_sum":
+        return sum(values)
+    if mode == "average":
+        total_weight = sum(weight for _, weight in trackers)
+        return sum(values) // total_weight if total_weight else 0
+    if mode == "capped_sum":
+        return sum(values) if cap is None else sum(min(value, cap) for value in values)
+    if mode == "max":
+        return max(values, default=0)
+    if mode == "min":
+        return min(values, default=0)
+    return None
 
 
 class TrackerScoreboardConfig(Serializable):
@@ -33,8 +57,10 @@ class Scoreboard(Serializable):
 
     id: str
     display_name_: Optional[str] = None
-    mode: str = "weighted_sum"  # or "average", "max", etc., not supported yet
+    mode: ScoreboardMode = "weighted_sum"
     trackers: List[TrackerScoreboardConfig] = []
+    # largest contribution of a single tracker in capped_sum mode, None for no cap
+    cap: Optional[int] = None
     comments: str = ""
 
     @property
@@ -51,17 +77,46 @@ class Scoreboard(Serializable):
             tracker = tracker.id
         self.trackers.append(TrackerScoreboardConfig(tracker_id=tracker, weight=weight))
 
-    def to_script(self)-> Dict:
+    def to_script(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None, compact: bool = False)-> Dict:
         '''
         used to generate the json file that the carpet script uses
+
+        with the inverted index of the registry, repeated trackers are merged into a single entry
+        compact leaves out the display name and mode when they are the defaults
         '''
-        # tracker_dicts = list(map(lambda tsc: tsc.to_script, self.trackers))
-        tracker_dicts = [tsc.to_script() for tsc in self.trackers]
-        return {
+        if tracker_index is None:
+            tracker_dicts = [tsc.to_script() for tsc in self.trackers]
+        else:
+            tracker_ids = dict.fromkeys(tsc.tracker_id for tsc in self.trackers)
+            tracker_dicts = [{"tracker_id": tracker_id, "weight": tracker_index[tracker_id][self.id]}
+                             for tracker_id in tracker_ids]
+        if compact:
+            data = {"trackers": tracker_dicts}
+            if self.display_name != self.id:
+                data["display_name"] = self.display_name
+            if self.mode != "weighted_sum":
+                data["mode"] = self.mode
+            if self.mode == "capped_sum" and self.cap is not None:
+                data["cap"] = self.cap
+            return data
+        data = {
             "display_name": self.display_name,
             "mode": self.mode,
             "trackers": tracker_dicts
         }
+        if self.mode == "capped_sum":
+            data["cap"] = self.cap
+        return data
+
+    def weights(self) -> Dict[str, int]:
+        '''
+        tracker id -> total weight, repeated trackers are merged like in the script data
+        '''
+        weights: Dict[str, int] = {}
+        for tsc in self.trackers:
+            weights[tsc.tracker_id] = weights.get(tsc.tracker_id, 0) + tsc.weight
+        return weights
+
     def show_info(self, src: CommandSource):
         '''
         show the scoreboard info to the command source
@@ -69,10 +124,20 @@ class Scoreboard(Serializable):
         src.reply(f"Scoreboard ID: {self.id}")
         src.reply(f"Display Name: {self.display_name or 'None'}")
         src.reply(f"Mode: {self.mode}")
-        if self.mode == "weighted_sum":
-            src.reply(f"Trackers: {', '.join([tsc.tracker_id for tsc in self.trackers])}")
+        if self.mode == "capped_sum":
+            src.reply(f"Cap: {self.cap if self.cap is not None else 'None'}")
+        src.reply(f"Trackers: {', '.join(f'{tracker_id} x{weight}' for tracker_id, weight in self.weights().items())}")
         if self.comments:
             src.reply(f"Comments: {self.comments}")
+
+    def score(self, counts: Dict[str, int]) -> Optional[int]:
+        '''
+        the score of a player from their tracker counts, the same as the script computes it
+
+        None if the mode is not supported
+        '''
+        return compute_score(self.mode, list(self.weights().items()), counts, self.cap)
+
     def has_tracker(self, tracker_id: str) -> bool:
         '''
         check if the scoreboard has a tracker
@@ -82,32 +147,72 @@ class Scoreboard(Serializable):
 
 class ScoreboardRegistry(Serializable):
     scoreboards: List[Scoreboard] = []
-    # def __init__(self):
-    #     self.scoreboards: List[Scoreboard] = []
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        # scoreboard id -> scoreboard, and its position in the scoreboards list, kept in sync with it
+        self._index: Dict[str, Scoreboard] = {sb.id: sb for sb in self.scoreboards}
+        self._positions: Dict[str, int] = positions_of(self.scoreboards)
+
+    def on_deserialization(self):
+        self._rebuild_index()
+
+    def merge_from(self, other: Self):
+        super().merge_from(other)
+        self._rebuild_index()
 
     def add(self, scoreboard: Scoreboard) -> None:
+        if scoreboard.id in self._index:
+            raise ValueError(f"Scoreboard with ID {scoreboard.id} already exists.")
         self.scoreboards.append(scoreboard)
+        self._index[scoreboard.id] = scoreboard
+        self._positions[scoreboard.id] = len(self.scoreboards) - 1
 
     def get_scoreboard(self, scoreboard_id: str) -> Optional[Scoreboard]:
-        for scoreboard in self.scoreboards:
-            if scoreboard.id == scoreboard_id:
-                return scoreboard
-        return None
+        return self._index.get(scoreboard_id)
 
     def remove(self, scoreboard_id: str) -> bool:
         """
-        Remove a scoreboard by its ID.
+        Remove a scoreboard by its ID, the last scoreboard takes its place.
         """
-        l = len(self.scoreboards)
-        self.scoreboards = [sb for sb in self.scoreboards if sb.id != scoreboard_id]
-        return l != len(self.scoreboards)
-    def update_json_file(self, file_path: str|Path) -> None:
-        # add all trackers to "default group"，area would be empty
-        data = {sb.id: sb.to_script() for sb in self.scoreboards}
+        if swap_remove(self.scoreboards, self._positions, scoreboard_id) is None:
+            return False
+        del self._index[scoreboard_id]
+        return True
+    def tracker_index(self) -> Dict[str, Dict[str, int]]:
+        '''
+        inverted index: tracker id -> scoreboard id -> total weight of the tracker in that scoreboard
 
+        built in a single pass, and shared by the json generation of both registries
+        '''
+        index: Dict[str, Dict[str, int]] = {}
+        for scoreboard in self.scoreboards:
+            for tsc in scoreboard.trackers:
+                weights = index.setdefault(tsc.tracker_id, {})
+                weights[scoreboard.id] = weights.get(scoreboard.id, 0) + tsc.weight
+        return index
+
+    def to_script(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None, compact: bool = False) -> Dict:
+        '''
+        used to generate the json file that the carpet script uses
+        '''
+        if tracker_index is None:
+            tracker_index = self.tracker_index()
+        return {sb.id: sb.to_script(tracker_index, compact) for sb in self.scoreboards}
+
+    def to_script_json(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None, compact: bool = False) -> str:
+        data = self.to_script(tracker_index, compact)
+        if compact:
+            return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(data, ensure_ascii=False, indent=4)
+
+    def update_json_file(self, file_path: str|Path, tracker_index: Optional[Dict[str, Dict[str, int]]] = None,
+                         compact: bool = False) -> None:
         with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.write(self.to_script_json(tracker_index, compact))
 
 
 
@@ -126,6 +231,8 @@ class ScoreboardRegistry(Serializable):
 
     def reset_all(self) -> None:
         self.scoreboards = []
+        self._index = {}
+        self._positions = {}
 
 if __name__ == "__main__":
     # Example usage
@@ -1,10 +1,78 @@
+import hashlib
+import json
+import re
 import shutil
 import os
+import threading
+from contextlib import contextmanager
+import uuid
+from time import monotonic, sleep
+from typing import Dict, Hashable, List, Optional, Set, Tuple, Iterator
+
+from mcdreforged.command.command_source import CommandSource
 from mcdreforged.plugin.si.server_interface import ServerInterface
 from pathlib import Path
 
-from advanced_tracking import TrackerRegistry, ScoreboardRegistry
+from advanced_tracking import TrackerRegistry, ScoreboardRegistry, Tracker, Scoreboard
+from advanced_tracking.backfill import EventJournal, JournalPrunedError, count_tracker, write_backfill
+from advanced_tracking.rebuild import compute_scores, score_batches
+from advanced_tracking.stats import ScriptStats
+from advanced_tracking.injection_worker import InjectionWorker
+from advanced_tracking.utils.perf import recorder
+from advanced_tracking.config import Config
 from advanced_tracking.utils.script_holder import CARPET_SCRIPT
+from advanced_tracking.utils.script_compiler import ScriptCompiler, render_script, render_statements, statement_command, \
+    to_scarpet
+from advanced_tracking.utils.data_diff import PatchOp, diff_data
+
+
+def content_hash(content: str|bytes) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def atomic_write(path: Path, content: str) -> None:
+    """
+    Write through a temporary file renamed over the target, so the script never reads a half written file.
+    """
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "w", encoding="utf-8", newline="") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+# longest command the server accepts
+MAX_COMMAND_LENGTH = 32500
+
+# seconds a backfill waits for the script to mark the journal, and between two looks at it
+BACKFILL_TIMEOUT = 30
+BACKFILL_POLL_INTERVAL = 0.05
+
+# owner of the batch of `!!at batch begin/commit/abort`
+COMMAND_BATCH = "command"
+
+# serialized tracker and scoreboard registries
+Snapshot = Tuple[dict, dict]
+
+
+def replay_changes(target: dict, before: dict, after: dict) -> None:
+    """
+    Apply the changes between two serialized registries to a third one, entry by entry id.
+    """
+    for key, entries in after.items():
+        old = {entry["id"]: entry for entry in before.get(key, [])}
+        new = {entry["id"]: entry for entry in entries}
+        changed = {entry_id for entry_id in old.keys() | new.keys() if old.get(entry_id) != new.get(entry_id)}
+        kept = []
+        for entry in target.get(key, []):
+            if entry["id"] not in changed:
+                kept.append(entry)
+            elif entry["id"] in new:
+                kept.append(new[entry["id"]])
+        present = {entry["id"] for entry in kept}
+        kept += [new[entry_id] for entry_id in new if entry_id in changed and entry_id not in present]
+        target[key] = kept
 
 
 class ScriptLoader():
@@ -17,49 +85,504 @@ class ScriptLoader():
         self.server: ServerInterface = server
         self.scoreboard_registry: ScoreboardRegistry = scoreboard_registry
         self.tracker_registry: TrackerRegistry = tracker_registry
+        # hashes of what was last written to each file, so unchanged payloads are not written and reloaded again
+        self._written_hashes: Dict[Path, Optional[str]] = {}
+        # owner -> serialized registries taken when its batch began
+        self._batches: Dict[Hashable, Snapshot] = {}
+        # injections requested while a batch was open
+        self._pending_injections: Set[str] = set()
+        # columns of the journal, kept between backfills so only new events are parsed
+        self._journal: Optional[EventJournal] = None
+        # held by a backfill from marking the journal to applying the counts
+        self._journal_lock = threading.Lock()
+        # data of the files as last injected, diffed against to send patches
+        # patches are numbered per session, so a patch left over from a previous one is never mistaken for a new one
+        self._patch_prefix: str = uuid.uuid4().hex[:8]
+        self._patch_sequence: int = 0
+        self._injected_data: Dict[Path, Optional[Dict]] = {}
+        # compiled statements in the deployed script, None for the generic script
+        self._compiled_statements: Optional[Dict[str, str]] = None
+        # held while injecting, and by commands while they edit the registries
+        self.lock = threading.RLock()
+        # command source of the command running on each thread, told when its injections are applied
+        self._requester = threading.local()
+        self._worker = InjectionWorker(server, self._run_injections)
+        # only what changed is loaded again, a plugin reload alone doesn't restart the app (see `!!at reload`)
         self.inject_all()
-    def inject_script(self):
+
+    # region batch editing
+    @property
+    def in_batch(self) -> bool:
         """
-        Injects the script into the server's script directory.
+        Whether any batch is open, injections are deferred until the last one ends.
         """
-        if not self.script_dst.exists():
-            self.script_dst.mkdir(parents=True, exist_ok=True)
-        with open(self.script_dst / "advanced_tracking.sc", "w") as script_file:
-            script_file.write(CARPET_SCRIPT)
-            self.server.execute("script load advanced_tracking global")
+        return bool(self._batches)
+
+    def has_batch(self, owner: Hashable = COMMAND_BATCH) -> bool:
+        return owner in self._batches
+
+    def _snapshot(self) -> Snapshot:
+        return self.tracker_registry.serialize(), self.scoreboard_registry.serialize()
+
+    def begin_batch(self, owner: Hashable = COMMAND_BATCH) -> None:
+        """
+        Start a batch: until it is committed, edits only change the registries and injections are deferred.
+        Every owner has its own batch, `!!at batch` uses COMMAND_BATCH.
+        """
+        with self.lock:
+            if owner in self._batches:
+                raise RuntimeError("A batch is already in progress.")
+            self._batches[owner] = self._snapshot()
+
+    def commit_batch(self, owner: Hashable = COMMAND_BATCH) -> None:
+        """
+        End the batch, and inject everything that changed once no batch is left open.
+        """
+        with self.lock:
+            if owner not in self._batches:
+                raise RuntimeError("No batch in progress.")
+            before = self._batches.pop(owner)
+            if self._batches:
+                # committed edits survive the other batches being aborted
+                after = self._snapshot()
+                for snapshot in self._batches.values():
+                    for key, data in enumerate(snapshot):
+                        replay_changes(data, before[key], after[key])
+            self._end_batch()
+
+    def abort_batch(self, owner: Hashable = COMMAND_BATCH) -> None:
+        """
+        End the batch and roll the registries back to how they were when it began,
+        keeping what other batches committed in the meantime.
+        """
+        with self.lock:
+            if owner not in self._batches:
+                raise RuntimeError("No batch in progress.")
+            tracker_data, scoreboard_data = self._batches.pop(owner)
+            # restore in place, the registries are shared with the config and the command manager
+            self.tracker_registry.merge_from(TrackerRegistry.deserialize(tracker_data))
+            self.scoreboard_registry.merge_from(ScoreboardRegistry.deserialize(scoreboard_data))
+            self._end_batch()
+
+    def _end_batch(self) -> None:
+        if self._batches:
+            return
+        # the registries may also have been edited directly, the written files are diffed anyway
+        pending, self._pending_injections = self._pending_injections | {"data"}, set()
+        # the worker merges them into as few writes and reloads as possible
+        for injection in pending:
+            self._request(injection)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Python API for other plugins, commits when the block exits and aborts if it raises:
+
+            with script_loader.batch():
+                tracker_registry.add(...)
+                ...
+
+        The lock is only taken to begin and end it, commands keep running meanwhile and their edits are kept
+        if the block raises.
+        """
+        owner = object()
+        self.begin_batch(owner)
+        try:
+            yield
+        except BaseException:
+            self.abort_batch(owner)
+            raise
+        self.commit_batch(owner)
+
+    @contextmanager
+    def edits_by(self, owner: Hashable = COMMAND_BATCH) -> Iterator[None]:
+        """
+        Edits made in this block belong to the owner, they survive the batches of other owners being aborted.
+        Hold the lock around it.
+        """
+        others = [other for other in self._batches if other != owner]
+        if not others:
+            yield
+            return
+        before = self._snapshot()
+        try:
+            yield
+        finally:
+            after = self._snapshot()
+            for other in others:
+                if other in self._batches:
+                    for key, data in enumerate(self._batches[other]):
+                        replay_changes(data, before[key], after[key])
+
+    def _defer(self, injection: str) -> bool:
+        if self.in_batch:
+            self._pending_injections.add(injection)
+            return True
+        return False
+    # endregion
+
+    def _execute(self, command: str) -> None:
+        # timed by script function, e.g. "execute load_trackers"
+        if " run " in command:
+            name = re.split(r"[ (]", command.split(" run ", 1)[1], 1)[0]
+            if name.startswith(("compiled_", "global_")):
+                name = "redefine"
+        else:
+            name = command.split(" advanced_tracking", 1)[0]
+        recorder.record_size(f"command {name}", len(command))
+        with recorder.timed(f"execute {name}"):
+            self.server.execute(command)
+
+    def _write_if_changed(self, path: Path, content: str) -> bool:
+        """
+        Writes the content to the file unless it already holds exactly that.
+        Returns whether the file was written.
+        """
+        digest = content_hash(content)
+        if path not in self._written_hashes:
+            # first time seeing this file in this session, e.g. after a plugin reload
+            self._written_hashes[path] = content_hash(path.read_bytes()) if path.exists() else None
+        if self._written_hashes[path] == digest:
+            return False
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+        recorder.record_size(f"payload {path.name}", len(content))
+        with recorder.timed(f"write {path.name}"):
+            atomic_write(path, content)
+        self._written_hashes[path] = digest
+        return True
+
+    def _compile(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None) -> Optional[Dict[str, str]]:
+        if not Config.get().compile_trackers:
+            return None
+        with recorder.timed("compile script"):
+            return ScriptCompiler(self.tracker_registry, self.scoreboard_registry, tracker_index,
+                                  stats=Config.get().collect_stats).compile_statements()
+
+    def _inject_script(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None,
+                       statements: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Injects the script into the server's script directory, and reloads it if it changed.
+        Returns whether it was reloaded, the script then reads every data file again.
+        """
+        if statements is None:
+            statements = self._compile(tracker_index)
+        content = CARPET_SCRIPT if statements is None else render_script(statements)
+        self._compiled_statements = statements
+        if self._write_if_changed(self.script_dst / "advanced_tracking.sc", content):
+            self._execute("script load advanced_tracking global")
+            return True
+        return False
+
+    def _write_settings(self) -> bool:
+        config = Config.get()
+        settings = {"flush_interval": config.flush_interval, "journal_events": config.journal_events,
+                    "journal_segment_events": config.journal_segment_events,
+                    "journal_max_segments": config.journal_max_segments,
+                    "collect_stats": config.collect_stats, "active_time_interval": config.active_time_interval,
+                    "afk_timeout": config.afk_timeout}
+        return self._write_if_changed(self.data_dst / "settings.json", json.dumps(settings, indent=4))
+
+    def _inject_settings(self):
+        if self._write_settings():
+            self._execute("script in advanced_tracking run load_settings(global_DATA_PATH)")
+
+    def flush_data(self):
+        """
+        Makes the script write all buffered player data to disk.
+        """
+        if self.server.is_server_running():
+            self._execute("script in advanced_tracking run flush_data()")
+
+    def read_stats(self) -> Optional[ScriptStats]:
+        """
+        The counters as of the last time the script dumped them, None if it never did.
+        """
+        return ScriptStats.from_file(self.data_dst / "stats.json")
+
+    def reset_stats(self):
+        if self.server.is_server_running():
+            self._execute("script in advanced_tracking run reset_stats()")
+
+    def backfill_tracker(self, tracker: Tracker, timeout: float = BACKFILL_TIMEOUT) -> Optional[Dict[str, int]]:
+        """
+        Recount the tracker over every journaled event and make the script replace the stored counts with the result,
+        plus what it counted live since the journal was read. Returns None if the script didn't mark the journal
+        within the timeout, raises JournalPrunedError and leaves the counts as they are if segments the tracker
+        counted were pruned.
+        Blocks until the script has flushed the journal, run it off the task executor, on a copy of the tracker.
+        """
+        with self._journal_lock:
+            if self._journal is None:
+                self._journal = EventJournal(self.data_dst / "journal")
+            marker = uuid.uuid4().hex
+            tracker_id = to_scarpet(tracker.id)
+            self._execute(f"script in advanced_tracking run begin_backfill({tracker_id}, '{marker}')")
+            deadline = monotonic() + timeout
+            while not self._journal.load_until(marker):
+                if monotonic() > deadline:
+                    return None
+                sleep(BACKFILL_POLL_INTERVAL)
+            if not self._journal.covers(tracker.created):
+                # without the counts the script only ends the backfill
+                self._execute(f"script in advanced_tracking run apply_backfill({tracker_id})")
+                raise JournalPrunedError(self._journal.start)
+            counts = count_tracker(self._journal, tracker)
+            write_backfill(self.data_dst, tracker.id, counts)
+            self._execute(f"script in advanced_tracking run apply_backfill({tracker_id})")
+            return counts
+
+    def rebuild_scoreboard(self, scoreboard: Scoreboard) -> int:
+        """
+        Recompute the scoreboard for every player from the files in tracked_data/, returns how many were sent.
+        Blocks while the batches are sent, run it off the task executor.
+        """
+        config = Config.get()
+        objective = to_scarpet(scoreboard.id)
+        prefix = f"script in advanced_tracking run set_scores({objective}, "
+        max_length = MAX_COMMAND_LENGTH - len(prefix) - 1
+        players = 0
+        scores = compute_scores(self.data_dst, scoreboard)
+        for batch in score_batches(scores, config.rebuild_batch_size, max_length):
+            if players:
+                # spread the batches over ticks instead of queueing them all at once
+                sleep(config.rebuild_batch_interval_ms / 1000)
+            self._execute(prefix + to_scarpet(batch) + ")")
+            players += len(batch)
+        # online players are skipped above, their counts in memory may be newer than their files
+        self._execute(f"script in advanced_tracking run recompute_objective({objective})")
+        return players
+
+    def _injected(self, path: Path) -> Optional[Dict]:
+        if path not in self._injected_data:
+            # first time seeing this file in this session, the script holds what is on disk
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._injected_data[path] = json.load(f)
+            except (OSError, ValueError):
+                self._injected_data[path] = None
+        return self._injected_data[path]
+
+    def _write_data(self, path: Path, content: str) -> Tuple[bool, Optional[List[PatchOp]]]:
+        """
+        Writes a data file if it changed.
+        Returns whether it was written, and the patch turning what the script holds into it,
+        None if it is not worth sending over reloading the file.
+        """
+        previous = self._injected(path)
+        if not self._write_if_changed(path, content):
+            return False, None
+        data = json.loads(content)
+        self._injected_data[path] = data
+        if not isinstance(previous, dict):
+            return True, None
+        with recorder.timed(f"diff {path.name}"):
+            ops = diff_data(previous, data)
+        if len(json.dumps(ops)) * 2 > len(content):
+            return True, None
+        return True, ops
+
+    def _write_scoreboard_data(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None) \
+            -> Tuple[bool, Optional[List[PatchOp]]]:
+        with recorder.timed("serialize scoreboards.json"):
+            content = self.scoreboard_registry.to_script_json(tracker_index, Config.get().compact_script_data)
+        return self._write_data(self.data_dst / "scoreboards.json", content)
+
+    def _write_tracker_data(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None) \
+            -> Tuple[bool, Optional[List[PatchOp]]]:
+        with recorder.timed("serialize trackers.json"):
+            content = self.tracker_registry.to_script_json(self.scoreboard_registry, tracker_index,
+                                                           Config.get().compact_script_data)
+        return self._write_data(self.data_dst / "trackers.json", content)
+
+    def _update_compiled(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None) -> bool:
+        """
+        Trackers and scoreboard weights are part of the compiled script, so it has to follow their changes.
+        Only the changed functions and globals are redefined in the loaded script when that is small enough,
+        otherwise it is reloaded. Returns whether it was reloaded.
+        """
+        if not Config.get().compile_trackers:
+            return False
+        statements = self._compile(tracker_index)
+        previous = self._compiled_statements
+        if previous is None:
+            return self._inject_script(statements=statements)
+        commands = [f"script in advanced_tracking run {statement_command(code)}"
+                    for name, code in statements.items() if previous.get(name) != code]
+        if sum(len(command) for command in commands) * 2 > len(render_statements(statements)) \
+                or any(len(command) > MAX_COMMAND_LENGTH for command in commands):
+            return self._inject_script(statements=statements)
+        # keep the file in sync for the next start, without reloading it
+        self._write_if_changed(self.script_dst / "advanced_tracking.sc", render_script(statements))
+        self._compiled_statements = statements
+        for command in commands:
+            self._execute(command)
+        return False
+
+    def _send_data(self, changes: Dict[str, Optional[List[PatchOp]]]) -> None:
+        """
+        Makes the script take the changed files: patches are sent together, the rest are loaded in full.
+        """
+        patch = {name: ops for name, ops in changes.items() if ops is not None}
+        if patch:
+            # not through _write_if_changed, the script deletes the patch once applied
+            self._patch_sequence += 1
+            name = f"{self._patch_prefix}_{self._patch_sequence}"
+            content = json.dumps(patch, ensure_ascii=False, separators=(",", ":"))
+            path = self.data_dst / "patches" / f"{name}.json"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            recorder.record_size("payload patch.json", len(content))
+            with recorder.timed("write patch.json"):
+                atomic_write(path, content)
+            self._execute(f"script in advanced_tracking run apply_patch(global_DATA_PATH, '{name}')")
+        for name, ops in changes.items():
+            if ops is None:
+                self._execute(f"script in advanced_tracking run load_{name}(global_DATA_PATH)")
+
+    # region injection
+    def _inject_scoreboard_data(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None):
+        changed, ops = self._write_scoreboard_data(tracker_index)
+        if changed and not self._update_compiled(tracker_index):
+            self._send_data({"scoreboards": ops})
+
+    def _inject_tracker_data(self, tracker_index: Optional[Dict[str, Dict[str, int]]] = None):
+        if Config.get().compile_trackers:
+            # the compiled functions hold the trackers, the script never reads trackers.json
+            self._update_compiled(tracker_index)
+            return
+        changed, ops = self._write_tracker_data(tracker_index)
+        if changed:
+            self._send_data({"trackers": ops})
+
+    def _inject_data(self):
+        # the tracker -> scoreboard index is built once and shared by both files
+        tracker_index = self.scoreboard_registry.tracker_index()
+        compiled = Config.get().compile_trackers
+        changes = {}
+        changed, ops = self._write_scoreboard_data(tracker_index)
+        if changed:
+            changes["scoreboards"] = ops
+        if not compiled:
+            changed, ops = self._write_tracker_data(tracker_index)
+            if changed:
+                changes["trackers"] = ops
+        if compiled and self._update_compiled(tracker_index):
+            return
+        if changes:
+            self._send_data(changes)
+
+    def _reload_all(self) -> None:
+        """
+        Writes whatever changed and loads the script even if nothing did, the script reads every data file
+        when it starts. The only way back after the app was unloaded, which the hashes can't tell, so it is only
+        done on `!!at reload`.
+        """
+        tracker_index = self.scoreboard_registry.tracker_index()
+        self._write_settings()
+        self._write_scoreboard_data(tracker_index)
+        if not Config.get().compile_trackers:
+            self._write_tracker_data(tracker_index)
+        statements = self._compile(tracker_index)
+        self._compiled_statements = statements
+        content = CARPET_SCRIPT if statements is None else render_script(statements)
+        self._write_if_changed(self.script_dst / "advanced_tracking.sc", content)
+        # patches not applied yet are part of the files the script is about to read
+        shutil.rmtree(self.data_dst / "patches", ignore_errors=True)
+        self._execute("script load advanced_tracking global")
+
+    def _run_injections(self, pending: Set[str]) -> None:
+        """
+        Apply a set of requested injections at once, each file is written and reloaded at most once.
+        """
+        with self.lock:
+            if "reload" in pending:
+                self._reload_all()
+                return
+            if "all" in pending:
+                self._inject_script()
+                self._inject_settings()
+                self._inject_data()
+                return
+            if "settings" in pending:
+                self._inject_settings()
+            if "data" in pending or {"scoreboards", "trackers"} <= pending:
+                self._inject_data()
+            elif "scoreboards" in pending:
+                self._inject_scoreboard_data()
+            elif "trackers" in pending:
+                self._inject_tracker_data()
+
+    @contextmanager
+    def requested_by(self, src: CommandSource) -> Iterator[None]:
+        """
+        Injections requested in this block, on this thread, are reported to the source once applied.
+        """
+        previous = getattr(self._requester, "src", None)
+        self._requester.src = src
+        try:
+            yield
+        finally:
+            self._requester.src = previous
+
+    @contextmanager
+    def inline_injections(self) -> Iterator[None]:
+        """
+        Injections requested in this block, on this thread, are applied right away instead of by the worker,
+        so that profiling a command includes them.
+        """
+        previous = getattr(self._requester, "inline", False)
+        self._requester.inline = True
+        try:
+            yield
+        finally:
+            self._requester.inline = previous
+
+    def _request(self, injection: str) -> None:
+        if self._defer(injection):
+            return
+        delay = Config.get().injection_delay_ms
+        if delay <= 0 or getattr(self._requester, "inline", False):
+            self._run_injections({injection})
+        else:
+            self._worker.request(injection, getattr(self._requester, "src", None), delay / 1000)
+
+    def wait_for_injections(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every requested injection has been applied, returns False on timeout.
+        """
+        return self._worker.wait_idle(timeout)
+
+    def close(self) -> None:
+        """
+        Apply the pending injections and stop the worker.
+        """
+        self._worker.stop()
+
+    def inject_settings(self):
+        """
+        Injects the runtime settings from the config, the script also reads them when it starts.
+        """
+        self._request("settings")
 
     def inject_scoreboard_data(self):
         """
         Injects the scoreboard data into the server's data directory.
         """
-        if not self.data_dst.exists():
-            self.data_dst.mkdir(parents=True, exist_ok=True)
+        self._request("scoreboards")
 
-        # Save scoreboards
-        scoreboards_path = self.data_dst / "scoreboards.json"
-        self.scoreboard_registry.update_json_file(scoreboards_path)
-
-        self.server.execute("script in advanced_tracking run load_scoreboards(global_DATA_PATH)")
     def inject_tracker_data(self):
         """
         Injects the tracker data into the server's data directory.
         """
-        if not self.data_dst.exists():
-            self.data_dst.mkdir(parents=True, exist_ok=True)
-
-        # Save trackers
-        trackers_path = self.data_dst / "trackers.json"
-        self.tracker_registry.update_json_file(trackers_path, self.scoreboard_registry.scoreboards)
-
-        self.server.execute("script in advanced_tracking run load_trackers(global_DATA_PATH)")
+        self._request("trackers")
 
     def inject_data(self):
-        self.inject_scoreboard_data()
-        self.inject_tracker_data()
+        self._request("data")
 
-    def inject_all(self):
+    def inject_all(self, force: bool = False):
         """
         Injects both the script and the data into the server's directories.
+        With force the script is loaded again even if no file changed.
         """
-        self.inject_script()
-        self.inject_data()
\ No newline at end of file
+        self._request("reload" if force else "all")
+    # endregion
@@ -0,0 +1,101 @@
+"""
+The counters the script keeps when collect_stats is on, read from the stats.json it dumps
+
+keys of the counters are space separated, ids can't contain spaces:
+    e <tracker_type> events|timed|time          events handled, events timed and their total time in ms
+    g <tracker_type> <group_id> checks|rejects
+    t <tracker_id> checks|area_rejects
+    c <tracker_id> <component_id> checks|area_rejects|block_rejects|matches
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class TrackerStats:
+    def __init__(self, id: str):
+        self.id: str = id
+        self.checks: int = 0
+        self.area_rejects: int = 0
+        # component id -> counter -> value
+        self.components: Dict[str, Dict[str, int]] = {}
+
+    def component_total(self, counter: str) -> int:
+        return sum(counters.get(counter, 0) for counters in self.components.values())
+
+    @property
+    def matches(self) -> int:
+        return self.component_total("matches")
+
+    @property
+    def block_checks(self) -> int:
+        # the block filter is only checked once the area passed
+        return self.component_total("checks") - self.component_total("area_rejects")
+
+    @property
+    def cost(self) -> int:
+        '''
+        rough amount of work spent on this tracker: every area check, plus the block filter checks
+        '''
+        return self.checks + self.component_total("checks") + self.block_checks
+
+    @property
+    def hit_rate(self) -> float:
+        return self.matches / self.checks if self.checks else 0.0
+
+
+class ScriptStats:
+    def __init__(self, tick: int = 0):
+        self.tick: int = tick
+        # tracker type -> counter -> value
+        self.events: Dict[str, Dict[str, float]] = {}
+        # (tracker type, group id) -> counter -> value
+        self.groups: Dict[tuple, Dict[str, int]] = {}
+        self.trackers: Dict[str, TrackerStats] = {}
+
+    @classmethod
+    def from_data(cls, data: Dict) -> 'ScriptStats':
+        stats = cls(data.get("tick", 0))
+        for key, value in data.get("counters", {}).items():
+            kind, *ids, counter = key.split(" ")
+            if kind == "e" and len(ids) == 1:
+                stats.events.setdefault(ids[0], {})[counter] = value
+            elif kind == "g" and len(ids) == 2:
+                stats.groups.setdefault(tuple(ids), {})[counter] = value
+            elif kind == "t" and len(ids) == 1:
+                tracker = stats.tracker(ids[0])
+                if counter == "checks":
+                    tracker.checks = value
+                elif counter == "area_rejects":
+                    tracker.area_rejects = value
+            elif kind == "c" and len(ids) == 2:
+                stats.tracker(ids[0]).components.setdefault(ids[1], {})[counter] = value
+        return stats
+
+    @classmethod
+    def from_file(cls, path: str|Path) -> Optional['ScriptStats']:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_data(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def tracker(self, tracker_id: str) -> TrackerStats:
+        if tracker_id not in self.trackers:
+            self.trackers[tracker_id] = TrackerStats(tracker_id)
+        return self.trackers[tracker_id]
+
+    def average_time(self, tracker_type: str) -> Optional[float]:
+        '''
+        average time of update_block_tracker in ms over the timed events
+        '''
+        events = self.events.get(tracker_type, {})
+        if not events.get("timed"):
+            return None
+        return events.get("time", 0) / events["timed"]
+
+    def hottest(self, count: int) -> List[TrackerStats]:
+        return sorted(self.trackers.values(), key=lambda tracker: tracker.matches, reverse=True)[:count]
+
+    def most_expensive(self, count: int) -> List[TrackerStats]:
+        return sorted(self.trackers.values(), key=lambda tracker: tracker.cost, reverse=True)[:count]
@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import Dict, Optional, List, Literal
+from typing import Dict, Optional, List, Literal, Set, TYPE_CHECKING
 import types
 
 from mcdreforged.command.command_source import CommandSource
@@ -9,25 +9,41 @@ from typing_extensions import Self
 
 # from advanced_tracking import Scoreboard
 from advanced_tracking.project_types import BlockTypes
-from advanced_tracking.project_types import TrackerType, TrackerMode
+from advanced_tracking.project_types import TrackerType, TrackerMode, TIME_TRACKER_TYPES
+from advanced_tracking.area import intersect_areas, chunk_range, chunk_key, bounding_box, normalize_areas, volume
+from advanced_tracking.group_planner import plan_partitions
+from advanced_tracking.utils.indexed_list import positions_of, swap_remove
 
+if TYPE_CHECKING:
+    from advanced_tracking.scoreboard import ScoreboardRegistry
 
 
 class TrackerComponent(Serializable):
     id: str
     area: Dict[str, int] = {}
+    # as returned by player~'dimension' in the script, e.g. "the_nether", None for the dimension of the tracker
+    dimension: Optional[str] = None
     block_type: BlockTypes = BlockTypes()
     comments: str = ""
 
-    def to_script(self) -> Dict:
+    def to_script(self, compact: bool = False) -> Dict:
+        if compact:
+            data = {}
+            if self.area:
+                data["area"] = self.area
+            if self.block_type.mode is not None:
+                data["block_type"] = self.block_type.to_script(compact=True)
+            return data
         return {
             "area": self.area,
-            "block_type": self.block_type.serialize()
+            "block_type": self.block_type.to_script()
         }
 
     def show_info(self, src: CommandSource) -> None:
         src.reply(f"Component ID: {self.id}")
         src.reply(f"Area: {self.area}")
+        if self.dimension is not None:
+            src.reply(f"Dimension: {self.dimension}")
         src.reply(f"Block Type: {self.block_type}")
         if self.comments:
             src.reply(f"Comments: {self.comments}")
@@ -38,82 +54,298 @@ class Tracker(Serializable):
     type: TrackerType
     mode: TrackerMode = "union"
     area: Dict[str, int]={}
+    # None matches in every dimension
+    dimension: Optional[str] = None
     components: List[TrackerComponent] = []
     comments: str = ""
+    # unix time the tracker was added at, 0 for trackers added before it was recorded
+    created: float = 0.0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        # component id -> component, and its position in the components list, kept in sync with it
+        self._component_index: Dict[str, TrackerComponent] = {comp.id: comp for comp in self.components}
+        self._component_positions: Dict[str, int] = positions_of(self.components)
+
+    def on_deserialization(self):
+        self._rebuild_index()
+
     def add_component(self, component: TrackerComponent) -> None:
         """Add a component to the tracker."""
-        for existing_component in self.components:
-            if existing_component.id == component.id:
-                raise ValueError(f"Component with ID {component.id} already exists in tracker {self.id}.")
+        if component.id in self._component_index:
+            raise ValueError(f"Component with ID {component.id} already exists in tracker {self.id}.")
         self.components.append(component)
+        self._component_index[component.id] = component
+        self._component_positions[component.id] = len(self.components) - 1
     def remove_component(self, component_id: str) -> bool:
-        """Remove a component by its ID."""
-        for component in self.components:
-            if component.id == component_id:
-                self.components.remove(component)
-                return True
-        return False
-
-    def to_script(self) -> Dict:
+        """Remove a component by its ID, the last component takes its place."""
+        if swap_remove(self.components, self._component_positions, component_id) is None:
+            return False
+        del self._component_index[component_id]
+        return True
+
+    def clear_components(self) -> None:
+        """Remove all components."""
+        self.components = []
+        self._component_index = {}
+        self._component_positions = {}
+
+    @property
+    def counts_blocks(self) -> bool:
+        """Whether the tracker counts block events, time trackers only look at the areas of their components."""
+        return self.type not in TIME_TRACKER_TYPES
+
+    def dimensions(self) -> Set[str]:
+        """The dimensions the tracker or some of its components are restricted to."""
+        dimensions = {comp.dimension for comp in self.components if comp.dimension is not None}
+        if self.dimension is not None:
+            dimensions.add(self.dimension)
+        return dimensions
+
+    def for_dimension(self, dimension: str) -> Optional['Tracker']:
+        """
+        The tracker as the script sees it in the partition of a dimension, with only the components that can
+        match there. ANY_DIMENSION keeps only the ones matching in every dimension.
+        Returns the tracker itself if every component is kept, None if none is.
+        """
+        if self.dimension is not None and self.dimension != dimension:
+            return None
+        components = [comp for comp in self.components if comp.dimension in (None, dimension)]
+        if not components:
+            return None
+        if len(components) == len(self.components):
+            return self
+        return Tracker(id=self.id, type=self.type, mode=self.mode, area=self.area, dimension=self.dimension,
+                       components=components, created=self.created)
+
+    def script_components(self) -> List[TrackerComponent]:
+        """
+        The components as the script checks them, the tracker itself is left untouched.
+        Block filters are dropped from the components of time trackers.
+        In union mode only whether any component matches counts, so among components with the same block filter,
+        contained ones are dropped and ones forming a larger cuboid together are merged, keeping the first id.
+        The result is ordered largest first, as the script stops at the first match.
+        """
+        components = self.components
+        if not self.counts_blocks:
+            components = [comp if comp.block_type.mode is None else TrackerComponent(id=comp.id, area=comp.area)
+                          for comp in components]
+        if self.mode != "union":
+            return components
+        by_filter: Dict[str, List[TrackerComponent]] = {}
+        for component in components:
+            key = json.dumps(component.block_type.to_script(), sort_keys=True)
+            by_filter.setdefault(key, []).append(component)
+        normalized = []
+        for components in by_filter.values():
+            for area, source in normalize_areas([comp.area for comp in components]):
+                component = components[source]
+                if area != component.area:
+                    component = TrackerComponent(id=component.id, area=area, dimension=component.dimension,
+                                                 block_type=component.block_type)
+                normalized.append(component)
+        order = {comp.id: position for position, comp in enumerate(self.components)}
+        normalized.sort(key=lambda comp: (-volume(comp.area), order[comp.id]))
+        return normalized
+
+    def to_script(self, compact: bool = False) -> Dict:
+        components = self.script_components()
+        # the area checked by the script is the effective one, so events away from every component are
+        # rejected at the tracker even if no area was set
+        area = self.effective_area()
+        if area is None:
+            area = self.area
+        if compact:
+            # the script treats a missing mode as union, and a missing area as unbounded
+            data = {"components": {comp.id: comp.to_script(compact=True) for comp in components}}
+            if self.mode != "union":
+                data["mode"] = self.mode
+            if area:
+                data["area"] = area
+            return data
         return {
-            "area": self.area,
-            "components": {comp.id: comp.to_script() for comp in self.components}
+            "mode": self.mode,
+            "area": area,
+            "components": {comp.id: comp.to_script() for comp in components}
         }
 
+    def effective_area(self) -> Optional[Dict[str, int]]:
+        """
+        The area this tracker can actually match in: its own area clipped to the bounding box of its components.
+        An axis stays open only if the tracker and one of its components are both open on it.
+        Returns None if it can never match.
+        """
+        if not self.components:
+            return None
+        return intersect_areas(self.area, bounding_box(comp.area for comp in self.components))
+
+    def index_chunks(self) -> Optional[Dict[str, List[str]]]:
+        """
+        Map every chunk this tracker can match in to the ids of the components covering it.
+        Returns None if any component is unbounded, in which case the tracker is checked on every event.
+        """
+        chunks: Dict[str, List[str]] = {}
+        for component in self.script_components():
+            area = intersect_areas(self.area, component.area)
+            if area is None:
+                # can never match
+                continue
+            bounds = chunk_range(area)
+            if bounds is None:
+                return None
+            cx_min, cx_max, cz_min, cz_max = bounds
+            for cx in range(cx_min, cx_max + 1):
+                for cz in range(cz_min, cz_max + 1):
+                    chunks.setdefault(chunk_key(cx, cz), []).append(component.id)
+        return chunks
+
     def show_info(self, src: CommandSource) -> None:
         src.reply(f"Tracker ID: {self.id}")
         src.reply(f"Type: {self.type}")
         src.reply(f"Area: {self.area}")
+        src.reply(f"Dimension: {self.dimension or 'any'}")
         src.reply(f"Components: {[comp.id for comp in self.components]}")
         if self.comments:
             src.reply(f"Comments: {self.comments}")
 
     def get_component(self, component_id: str) -> Optional[TrackerComponent]:
-        for component in self.components:
-            if component.id == component_id:
-                return component
-        return None
+        return self._component_index.get(component_id)
 
 class TrackerRegistry(Serializable):
     """Registry for all trackers."""
     trackers: List[Tracker]=[]
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        # tracker id -> tracker, and its position in the trackers list, kept in sync with it
+        self._index: Dict[str, Tracker] = {tracker.id: tracker for tracker in self.trackers}
+        self._positions: Dict[str, int] = positions_of(self.trackers)
+
+    def on_deserialization(self):
+        self._rebuild_index()
+
+    def merge_from(self, other: Self):
+        super().merge_from(other)
+        self._rebuild_index()
+
     def add(self, tracker: Tracker) -> None:
         """Add a tracker to the registry."""
-        for tracker_ in self.trackers:
-            if tracker_.id == tracker.id:
-                raise ValueError(f"Tracker with ID {tracker.id} already exists.")
+        if tracker.id in self._index:
+            raise ValueError(f"Tracker with ID {tracker.id} already exists.")
         self.trackers.append(tracker)
+        self._index[tracker.id] = tracker
+        self._positions[tracker.id] = len(self.trackers) - 1
 
 
     def remove_tracker(self, tracker_id: str) -> bool:
-        """Delete a tracker by its ID."""
-        for tracker in self.trackers:
-            if tracker.id == tracker_id:
-                self.trackers.remove(tracker)
-                return True
-        return False
+        """Delete a tracker by its ID, the last tracker takes its place."""
+        if swap_remove(self.trackers, self._positions, tracker_id) is None:
+            return False
+        del self._index[tracker_id]
+        return True
 
 
-    def update_json_file(self, file_path: str|Path, scoreboards: List['Scoreboard']) -> None:
-        # add all trackers to "default group"，area would be empty
-        tracker_types = ["player_break_blocks", "player_place_blocks"]
-        data = {"player_break_blocks":{"default_group": {"area":{}, "trackers":{}}},
-                "player_place_blocks":{"default_group": {"area":{}, "trackers":{}}}}
-        for tracker in self.trackers:
-            data[tracker.type]["default_group"]["trackers"][tracker.id] = tracker.to_script()
-            data[tracker.type]["default_group"]["trackers"][tracker.id]["scoreboards"] = [
-                scoreboard.id for scoreboard in scoreboards if scoreboard.has_tracker(tracker.id)
-            ]
+    def to_script(self, scoreboard_registry: 'ScoreboardRegistry',
+                  tracker_index: Optional[Dict[str, Dict[str, int]]] = None, compact: bool = False) -> Dict:
+        """
+        used to generate the json file that the carpet script uses
+
+        tracker_index is the inverted index from ScoreboardRegistry.tracker_index, built here if not given
+        compact leaves out empty and default fields, and stores block type filters once in "block_types",
+        components then refer to them by position
+        """
+        if tracker_index is None:
+            tracker_index = scoreboard_registry.tracker_index()
+        # trackers are partitioned by dimension, and split into groups of nearby trackers, so the script only looks
+        # at the partition of the player's dimension, and skips far away groups at once
+        plan = plan_partitions(self.trackers)
+        data = {tracker_type: {} for tracker_type in plan}
+        # spatial index per dimension partition: chunk -> group -> tracker -> candidate components
+        # trackers that can't be bucketed go to "global", which is checked on every event
+        index = {tracker_type: {} for tracker_type in plan}
+        # interned block type filters, and their position by content
+        block_types: List[Dict] = []
+        block_type_positions: Dict[str, int] = {}
+
+        def intern_block_type(block_type: Dict) -> int:
+            key = json.dumps(block_type, sort_keys=True)
+            if key not in block_type_positions:
+                block_type_positions[key] = len(block_types)
+                block_types.append(block_type)
+            return block_type_positions[key]
 
+        for tracker_type, partitions in plan.items():
+            for dimension, groups in partitions.items():
+                partition_data = data[tracker_type][dimension] = {}
+                partition_index = index[tracker_type][dimension] = {"global": {}, "chunks": {}}
+                for group_id, group in groups.items():
+                    partition_data[group_id] = {"area": group.area, "trackers": {}}
+                    if compact and not group.area:
+                        del partition_data[group_id]["area"]
+                    for tracker in group.trackers:
+                        tracker_data = tracker.to_script(compact)
+                        # objective -> weight, applied as a delta to the objective on every count
+                        tracker_data["scoreboards"] = {
+                            scoreboard_id: weight for scoreboard_id, weight in tracker_index.get(tracker.id, {}).items()
+                            if scoreboard_registry.get_scoreboard(scoreboard_id).mode == "weighted_sum"
+                        }
+                        # objective -> weight, for the other modes, updated from the state the script keeps per player
+                        tracker_data["stateful_scoreboards"] = {
+                            scoreboard_id: weight for scoreboard_id, weight in tracker_index.get(tracker.id, {}).items()
+                            if scoreboard_registry.get_scoreboard(scoreboard_id).mode != "weighted_sum"
+                        }
+                        if compact:
+                            if not tracker_data["scoreboards"]:
+                                del tracker_data["scoreboards"]
+                            if not tracker_data["stateful_scoreboards"]:
+                                del tracker_data["stateful_scoreboards"]
+                            for component_data in tracker_data["components"].values():
+                                if "block_type" in component_data:
+                                    component_data["block_type"] = intern_block_type(component_data["block_type"])
+                        partition_data[group_id]["trackers"][tracker.id] = tracker_data
+                        chunks = tracker.index_chunks()
+                        if chunks is None:
+                            partition_index["global"].setdefault(group_id, {})[tracker.id] = \
+                                [comp.id for comp in tracker.script_components()]
+                            continue
+                        for key, component_ids in chunks.items():
+                            partition_index["chunks"].setdefault(key, {}).setdefault(group_id, {})[tracker.id] = \
+                                component_ids
+        if compact:
+            for tracker_type in plan:
+                if not data[tracker_type]:
+                    del data[tracker_type]
+                for partition_index in index[tracker_type].values():
+                    for key in ("global", "chunks"):
+                        if not partition_index[key]:
+                            del partition_index[key]
+                if not index[tracker_type]:
+                    del index[tracker_type]
+            if block_types:
+                data["block_types"] = block_types
+        data["index"] = index
+        return data
+
+    def to_script_json(self, scoreboard_registry: 'ScoreboardRegistry',
+                       tracker_index: Optional[Dict[str, Dict[str, int]]] = None, compact: bool = False) -> str:
+        data = self.to_script(scoreboard_registry, tracker_index, compact)
+        if compact:
+            return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(data, ensure_ascii=False, indent=4)
+
+    def update_json_file(self, file_path: str|Path, scoreboard_registry: 'ScoreboardRegistry',
+                         tracker_index: Optional[Dict[str, Dict[str, int]]] = None, compact: bool = False) -> None:
         with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.write(self.to_script_json(scoreboard_registry, tracker_index, compact))
 
     def get_tracker(self, tracker_id: str) -> Optional[Tracker]:
-        for tracker in self.trackers:
-            if tracker.id == tracker_id:
-                return tracker
-        return None
+        return self._index.get(tracker_id)
 
     def list_trackers(self, src: CommandSource):
         """List all trackers."""
@@ -125,6 +357,8 @@ class TrackerRegistry(Serializable):
 
     def reset_all(self) -> None:
         self.trackers = []
+        self._index = {}
+        self._positions = {}
 
 if __name__ == "__main__":
     # Example usage
@@ -144,4 +378,5 @@ if __name__ == "__main__":
 
     print(data.__eq__(reloaded_tr.serialize()))
 
-    tracker_registry.update_json_file("trackers.json")
\ No newline at end of file
+    from advanced_tracking.scoreboard import ScoreboardRegistry
+    tracker_registry.update_json_file("trackers.json", ScoreboardRegistry())
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""
+Diff of the json data injected into the script, sent as a patch instead of the whole file
+"""
+from typing import Any, List, Tuple
+
+# (keys to the value, new value), None deletes the key, see apply_patch in the script
+PatchOp = Tuple[List[str], Any]
+
+
+def diff_data(old: Any, new: Any, keys: Tuple[str, ...] = ()) -> List[PatchOp]:
+    '''
+    the operations turning old into new, maps are diffed key by key and everything else is replaced at once
+    '''
+    if old == new:
+        return []
+    if not (isinstance(old, dict) and isinstance(new, dict)):
+        return [(list(keys), new)]
+    ops: List[PatchOp] = []
+    for key in old:
+        if key not in new:
+            ops.append((list(keys) + [key], None))
+    for key, value in new.items():
+        if key not in old:
+            ops.append((list(keys) + [key], value))
+        else:
+            ops += diff_data(old[key], value, keys + (key,))
+    return ops
@@ -0,0 +1,29 @@
+"""
+Constant time removal from the lists of the registries, which are also indexed by id
+"""
+from typing import Dict, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+def positions_of(items: List[T]) -> Dict[str, int]:
+    '''
+    id -> position in the list
+    '''
+    return {item.id: position for position, item in enumerate(items)}
+
+
+def swap_remove(items: List[T], positions: Dict[str, int], item_id: str) -> Optional[T]:
+    '''
+    remove the item with the id in O(1): the last item takes its place, so it moves forward in the list
+    positions is kept in sync, returns the removed item, None if there is none with that id
+    '''
+    position = positions.pop(item_id, None)
+    if position is None:
+        return None
+    item = items[position]
+    last = items.pop()
+    if last is not item:
+        items[position] = last
+        positions[last.id] = position
+    return item
@@ -0,0 +1,108 @@
+"""
+Timing and payload size recording for commands and injections, shown by `!!at perf`
+"""
+import cProfile
+import io
+import pstats
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Deque, Dict, Iterator, List, Optional
+
+# samples kept per histogram, older ones are dropped
+HISTOGRAM_SIZE = 512
+
+
+class RollingHistogram:
+    '''
+    the last HISTOGRAM_SIZE samples of a value, with the total count
+    '''
+    def __init__(self, size: int = HISTOGRAM_SIZE):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.count: int = 0
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    @property
+    def max(self) -> float:
+        return max(self.samples, default=0.0)
+
+    @property
+    def mean(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+
+class PerfRecorder:
+    '''
+    durations (in ms) and payload sizes (in bytes) by name, e.g. "command cmd_add_component" or "write trackers.json"
+    '''
+    def __init__(self):
+        self.durations: Dict[str, RollingHistogram] = {}
+        self.sizes: Dict[str, RollingHistogram] = {}
+        # commands and the script loader may run on different threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _histogram(histograms: Dict[str, RollingHistogram], name: str) -> RollingHistogram:
+        if name not in histograms:
+            histograms[name] = RollingHistogram()
+        return histograms[name]
+
+    def record_duration(self, name: str, ms: float) -> None:
+        with self._lock:
+            self._histogram(self.durations, name).add(ms)
+
+    def record_size(self, name: str, size: int) -> None:
+        with self._lock:
+            self._histogram(self.sizes, name).add(size)
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record_duration(name, (perf_counter() - start) * 1000)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.durations = {}
+            self.sizes = {}
+
+    def report(self) -> List[str]:
+        with self._lock:
+            lines = []
+            for name, histogram in sorted(self.durations.items()):
+                lines.append(f'{name}: {histogram.count}x, p50 {histogram.percentile(0.5):.2f} ms, '
+                             f'p90 {histogram.percentile(0.9):.2f} ms, p99 {histogram.percentile(0.99):.2f} ms, '
+                             f'max {histogram.max:.2f} ms')
+            for name, histogram in sorted(self.sizes.items()):
+                lines.append(f'{name}: {histogram.count}x, mean {histogram.mean:.0f} B, '
+                             f'p90 {histogram.percentile(0.9):.0f} B, max {histogram.max:.0f} B')
+            return lines
+
+
+# shared by the command manager and the script loader
+recorder = PerfRecorder()
+
+
+def profile_call(func, *args, output: Optional[str] = None, lines: int = 15) -> str:
+    '''
+    run func under cProfile, returns the top functions by cumulative time, and saves the raw stats to output
+    '''
+    profiler = cProfile.Profile()
+    profiler.runcall(func, *args)
+    if output is not None:
+        profiler.dump_stats(output)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(lines)
+    return stream.getvalue()
@@ -0,0 +1,268 @@
+"""
+A pure python reference implementation of the matching done by the carpet script in script_holder.py
+
+It consumes the same trackers.json / scoreboards.json the registries generate (compact or not),
+so the matching semantics and cost can be checked without a minecraft server.
+It models the generic script only: with compile_trackers on (the default), the generated matchers are deployed
+instead and trackers.json is not written.
+"""
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from advanced_tracking.project_types import ANY_DIMENSION
+from advanced_tracking.scoreboard import compute_score
+
+Position = Tuple[float, float, float]
+
+
+class BlockEvent:
+    '''
+    a block broken or placed by a player, as the script sees it
+    '''
+    def __init__(self, player: str, tracker_type: str, pos: Position, block: str,
+                 state: Optional[Dict[str, Any]] = None, dimension: str = "overworld"):
+        self.player: str = player
+        self.tracker_type: str = tracker_type
+        # position of the player, which is what areas are checked against
+        self.pos: Position = pos
+        self.block: str = block
+        self.state: Dict[str, Any] = state if state is not None else {}
+        # of the player, as player~'dimension' returns it
+        self.dimension: str = dimension
+
+
+def _state_str(value: Any) -> str:
+    # str() of a block_state value in carpet
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+def block_in_list(block_filter: Dict[str, Any], block: str, state: Dict[str, Any]) -> bool:
+    '''
+    check_block_in_list of the script, against a compiled filter from BlockTypes.to_script
+    '''
+    if block in block_filter.get("names", {}):
+        return True
+    spec = block_filter.get("states", {}).get(block)
+    if spec is None:
+        return False
+    queried = {key: _state_str(state.get(key)) for key in spec["keys"]}
+    return any(all(queried[key] == value for key, value in requirement.items())
+               for requirement in spec["requirements"])
+
+
+def block_filter_matches(block_filter: Optional[Dict[str, Any]], block: str, state: Dict[str, Any]) -> bool:
+    '''
+    whether a block passes a compiled whitelist/blacklist filter, None or no mode lets everything pass
+    '''
+    if block_filter is None:
+        return True
+    if block_filter.get("mode") == "whitelist":
+        return block_in_list(block_filter, block, state)
+    if block_filter.get("mode") == "blacklist":
+        return not block_in_list(block_filter, block, state)
+    return True
+
+
+class ReferenceEvaluator:
+    '''
+    mirrors update_block_tracker, increment_tracker and the scoreboard functions of the script
+
+    counts, scores and the number of area/block checks are kept in memory
+    '''
+    def __init__(self, trackers: Dict[str, Any], scoreboards: Dict[str, Any]):
+        self.trackers: Dict[str, Any] = trackers
+        self.scoreboards: Dict[str, Any] = scoreboards
+        for config in self.scoreboards.values():
+            config.setdefault("mode", "weighted_sum")
+        # player -> tracker id -> count
+        self.counts: Dict[str, Dict[str, int]] = {}
+        # objective -> player -> score
+        self.scores: Dict[str, Dict[str, int]] = {objective: {} for objective in self.scoreboards}
+        # objective -> player -> state of the modes other than weighted_sum, see scoreboard_state in the script
+        self.states: Dict[str, Dict[str, list]] = {objective: {} for objective in self.scoreboards}
+        self.area_checks: int = 0
+        self.block_checks: int = 0
+        self.events: int = 0
+
+    @classmethod
+    def from_files(cls, trackers_path: str|Path, scoreboards_path: str|Path) -> 'ReferenceEvaluator':
+        with open(trackers_path, encoding="utf-8") as f:
+            trackers = json.load(f)
+        with open(scoreboards_path, encoding="utf-8") as f:
+            scoreboards = json.load(f)
+        return cls(trackers, scoreboards)
+
+    @property
+    def checks(self) -> int:
+        return self.area_checks + self.block_checks
+
+    def reset_stats(self) -> None:
+        self.area_checks = 0
+        self.block_checks = 0
+        self.events = 0
+
+    # region matching
+    def check_player_in_area(self, pos: Position, area: Optional[Dict[str, int]]) -> bool:
+        self.area_checks += 1
+        if area is None:
+            return True
+        for value, axis in zip(pos, ("x", "y", "z")):
+            lo = area.get(axis + "_min")
+            hi = area.get(axis + "_max")
+            if lo is not None and lo > value:
+                return False
+            if hi is not None and hi < value:
+                return False
+        return True
+
+    def check_block_in_list(self, event: BlockEvent, block_filter: Dict[str, Any]) -> bool:
+        self.block_checks += 1
+        return block_in_list(block_filter, event.block, event.state)
+
+    def match_component(self, component: Dict[str, Any], event: BlockEvent) -> bool:
+        if not self.check_player_in_area(event.pos, component.get("area")):
+            return False
+        block_filter = component.get("block_type")
+        if block_filter is None:
+            return True
+        if isinstance(block_filter, int):
+            block_filter = self.trackers["block_types"][block_filter]
+        if block_filter.get("mode") == "whitelist":
+            return self.check_block_in_list(event, block_filter)
+        if block_filter.get("mode") == "blacklist":
+            return not self.check_block_in_list(event, block_filter)
+        return True
+
+    def match_candidates(self, event: BlockEvent, groups: Dict[str, Any],
+                         candidates: Optional[Dict[str, Dict[str, List[str]]]]) -> List[str]:
+        matched: List[str] = []
+        if candidates is None:
+            return matched
+        for group_id, tracker_candidates in candidates.items():
+            group = groups[group_id]
+            if not self.check_player_in_area(event.pos, group.get("area")):
+                continue
+            for tracker_id, component_ids in tracker_candidates.items():
+                tracker = group["trackers"][tracker_id]
+                if not self.check_player_in_area(event.pos, tracker.get("area")):
+                    continue
+                for component_id in component_ids:
+                    if self.match_component(tracker["components"][component_id], event):
+                        self.increment_tracker(tracker_id, event.player)
+                        self.apply_scoreboard_deltas(tracker.get("scoreboards"), event.player)
+                        self.update_stateful_scoreboards(tracker.get("stateful_scoreboards"), tracker_id, event.player)
+                        matched.append(tracker_id)
+                        if tracker.get("mode") != "sum":
+                            break
+        return matched
+
+    def process(self, event: BlockEvent) -> List[str]:
+        '''
+        handle one event, returns the ids of the trackers it counted for (a sum mode tracker may repeat)
+        '''
+        self.events += 1
+        partitions = self.trackers.get("index", {}).get(event.tracker_type)
+        if partitions is None:
+            return []
+        # the partition of the dimension, or the one for every other dimension
+        partition = event.dimension if event.dimension in partitions else ANY_DIMENSION
+        index = partitions.get(partition)
+        if index is None:
+            return []
+        groups = self.trackers[event.tracker_type][partition]
+        matched = self.match_candidates(event, groups, index.get("global"))
+        chunks = index.get("chunks")
+        if chunks is not None:
+            key = f"{math.floor(event.pos[0] / 16)},{math.floor(event.pos[2] / 16)}"
+            matched += self.match_candidates(event, groups, chunks.get(key))
+        return matched
+    # endregion
+
+    # region data and scoreboards
+    def increment_tracker(self, tracker_id: str, player: str) -> None:
+        counts = self.counts.setdefault(player, {})
+        counts[tracker_id] = counts.get(tracker_id, 0) + 1
+
+    def apply_scoreboard_deltas(self, deltas: Optional[Dict[str, int]], player: str) -> None:
+        if deltas is None:
+            return
+        for objective, weight in deltas.items():
+            scores = self.scores.setdefault(objective, {})
+            scores[player] = scores.get(player, 0) + weight
+
+    def update_stateful_scoreboards(self, objectives: Optional[Dict[str, int]], tracker_id: str, player: str,
+                                    amount: int = 1) -> None:
+        if objectives is None:
+            return
+        count = self.counts[player][tracker_id]
+        for objective, weight in objectives.items():
+            config = self.scoreboards[objective]
+            state = self.states[objective].get(player)
+            if state is None:
+                self.update_scoreboard(objective, player)
+                continue
+            value, previous = count * weight, (count - amount) * weight
+            scores = self.scores[objective]
+            mode = config["mode"]
+            if mode in ("average", "capped_sum"):
+                cap = config.get("cap") if mode == "capped_sum" else None
+                if cap is not None:
+                    value, previous = min(value, cap), min(previous, cap)
+                state[0] += value - previous
+                total_weight = sum(entry["weight"] for entry in config["trackers"])
+                if mode == "capped_sum":
+                    scores[player] = state[0]
+                else:
+                    scores[player] = state[0] // total_weight if total_weight else 0
+            elif mode == "max":
+                if value > state[0]:
+                    state[0], state[1] = value, tracker_id
+                    scores[player] = value
+                elif state[1] == tracker_id and value < previous:
+                    self.update_scoreboard(objective, player)
+            elif mode == "min":
+                if value < state[0]:
+                    state[0], state[1] = value, 1
+                    scores[player] = value
+                elif previous == state[0] and value != previous:
+                    state[1] -= 1
+                    if state[1] <= 0:
+                        self.update_scoreboard(objective, player)
+                elif value == state[0] and previous != value:
+                    state[1] += 1
+
+    def update_scoreboard(self, objective: str, player: str) -> None:
+        '''
+        full recompute of an objective from the counts, rebuilding the state
+        '''
+        config = self.scoreboards[objective]
+        trackers = [(entry["tracker_id"], entry["weight"]) for entry in config["trackers"]]
+        counts = self.counts.get(player, {})
+        score = compute_score(config["mode"], trackers, counts, config.get("cap"))
+        if score is None:
+            return
+        self.scores[objective][player] = score
+        mode = config["mode"]
+        values = [(counts.get(tracker_id, 0) * weight, tracker_id) for tracker_id, weight in trackers]
+        if mode in ("average", "capped_sum"):
+            cap = config.get("cap") if mode == "capped_sum" else None
+            self.states[objective][player] = [sum(value if cap is None else min(value, cap) for value, _ in values)]
+        elif mode == "max":
+            # the first tracker reaching the maximum
+            best = max((value for value, _ in values), default=0)
+            self.states[objective][player] = [best, next((t for value, t in values if value == best), None)]
+        elif mode == "min":
+            best = min((value for value, _ in values), default=0)
+            self.states[objective][player] = [best, sum(1 for value, _ in values if value == best)]
+
+    def recompute_scoreboards(self, player: str) -> None:
+        '''
+        full recompute from the counts, what the script does on load
+        '''
+        for objective in self.scoreboards:
+            self.update_scoreboard(objective, player)
+    # endregion
@@ -0,0 +1,306 @@
+"""
+Compiles the trackers into carpet code appended to CARPET_SCRIPT
+
+Instead of walking trackers.json for every event, the generated functions read the player position once,
+look up the trackers to call by the chunk it is in, compare it against constant bounds (leaving out the missing
+and redundant ones) and check blocks against block sets built when the script loads. The generic functions stay
+in the script for everything else.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from advanced_tracking.area import Area, AXES, axis_bounds
+from advanced_tracking.group_planner import plan_partitions
+from advanced_tracking.project_types import TIME_TRACKER_TYPES, ANY_DIMENSION
+from advanced_tracking.utils.script_holder import CARPET_SCRIPT
+
+if TYPE_CHECKING:
+    from advanced_tracking.tracker import Tracker, TrackerRegistry
+    from advanced_tracking.scoreboard import ScoreboardRegistry
+
+
+def to_scarpet(value: Any) -> str:
+    '''
+    a scarpet literal of a json-like value
+    '''
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{to_scarpet(key)} -> {to_scarpet(item)}' for key, item in value.items()) + '}'
+    return '[' + ', '.join(to_scarpet(item) for item in value) + ']'
+
+
+def stat_increment(key: str) -> str:
+    return f'global_stats:{to_scarpet(key)} += 1'
+
+
+def matcher_parameters(tracker_type: str) -> str:
+    '''
+    what the matcher functions of a type are called with, time trackers get the sampled ticks instead of a block
+    '''
+    if tracker_type in TIME_TRACKER_TYPES:
+        return 'player, ticks, x, y, z'
+    return 'player, block, name, x, y, z'
+
+
+def tracker_function_name(tracker_id: str, dimension: str = ANY_DIMENSION) -> str:
+    '''
+    name of the function matching a tracker in a dimension partition, stable for a given id and dimension
+    '''
+    key = tracker_id if dimension == ANY_DIMENSION else f'{tracker_id} {dimension}'
+    readable = re.sub(r'[^a-zA-Z0-9_]', '_', key)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]
+    return f'compiled_tracker_{readable}_{digest}'
+
+
+def matcher_function_name(tracker_type: str, dimension: str = ANY_DIMENSION) -> str:
+    if dimension == ANY_DIMENSION:
+        return f'compiled_{tracker_type}'
+    return f'compiled_{tracker_type}_{re.sub(r"[^a-zA-Z0-9_]", "_", dimension)}'
+
+
+def dispatch_global_names(tracker_type: str, dimension: str = ANY_DIMENSION) -> Tuple[str, str]:
+    '''
+    names of the chunk -> tracker functions map and of the list of unbounded tracker functions of a matcher
+    '''
+    matcher = matcher_function_name(tracker_type, dimension)
+    return f'global_{matcher}_chunks', f'global_{matcher}_unbounded'
+
+
+def bounds_condition(area: Optional[Area], known: Optional[Area] = None) -> List[str]:
+    '''
+    comparisons checking that (x, y, z) is in the area, bounds already guaranteed by the known area are left out
+    '''
+    known = known or {}
+    conditions = []
+    for axis in AXES:
+        lo, hi = axis_bounds(area or {}, axis)
+        known_lo, known_hi = axis_bounds(known, axis)
+        if lo is not None and (known_lo is None or known_lo < lo):
+            conditions.append(f'{axis} >= {lo}')
+        if hi is not None and (known_hi is None or known_hi > hi):
+            conditions.append(f'{axis} <= {hi}')
+    return conditions
+
+
+class ScriptCompiler:
+    '''
+    builds the compiled script for one configuration
+    '''
+    def __init__(self, tracker_registry: 'TrackerRegistry', scoreboard_registry: 'ScoreboardRegistry',
+                 tracker_index: Optional[Dict[str, Dict[str, int]]] = None, stats: bool = False):
+        self.tracker_registry: 'TrackerRegistry' = tracker_registry
+        self.scoreboard_registry: 'ScoreboardRegistry' = scoreboard_registry
+        self.tracker_index: Dict[str, Dict[str, int]] = \
+            tracker_index if tracker_index is not None else scoreboard_registry.tracker_index()
+        # count checks, matches and rejects into global_stats
+        self.stats: bool = stats
+        # interned block filters, emitted as globals
+        self._block_globals: Dict[str, str] = {}
+        self._block_definitions: Dict[str, str] = {}
+
+    def block_condition(self, block_filter: Dict[str, Any]) -> Optional[str]:
+        '''
+        the check of a compiled block filter, None if it lets everything through
+        '''
+        mode = block_filter.get('mode')
+        if mode is None:
+            return None
+        key = json.dumps(block_filter, sort_keys=True)
+        name = self._block_globals.get(key)
+        # named by content, so the names don't move when filters are added or removed
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]
+        if block_filter.get('states'):
+            if name is None:
+                name = self._block_globals[key] = f'global_block_filter_{digest}'
+                self._block_definitions[name] = f'{name} = {to_scarpet(block_filter)};'
+            condition = f'check_block_in_list(block, {name})'
+        else:
+            # only plain names, a set lookup is enough
+            if name is None:
+                name = self._block_globals[key] = f'global_block_set_{digest}'
+                self._block_definitions[name] = f'{name} = {to_scarpet(block_filter.get("names", {}))};'
+            condition = f'has({name}, name)'
+        return condition if mode == 'whitelist' else f'!{condition}'
+
+    def scoreboard_deltas(self, tracker: 'Tracker') -> Dict[str, int]:
+        return {scoreboard_id: weight for scoreboard_id, weight in self.tracker_index.get(tracker.id, {}).items()
+                if self.scoreboard_registry.get_scoreboard(scoreboard_id).mode == 'weighted_sum'}
+
+    def stateful_scoreboards(self, tracker: 'Tracker') -> Dict[str, int]:
+        return {scoreboard_id: weight for scoreboard_id, weight in self.tracker_index.get(tracker.id, {}).items()
+                if self.scoreboard_registry.get_scoreboard(scoreboard_id).mode != 'weighted_sum'}
+
+    def compile_tracker(self, tracker: 'Tracker', known: Optional[Area] = None,
+                        dimension: str = ANY_DIMENSION) -> str:
+        '''
+        the matcher function of a tracker, known is an area the position was already checked against
+
+        the tracker is the view of it in the given dimension partition, see Tracker.for_dimension
+        '''
+        area = tracker.effective_area() or {}
+        deltas = self.scoreboard_deltas(tracker)
+        if tracker.counts_blocks:
+            amount = '1'
+            statements = [f'increment_tracker({to_scarpet(tracker.id)}, player)']
+            if deltas:
+                statements.append(f'apply_scoreboard_deltas({to_scarpet(deltas)}, player)')
+        else:
+            # time trackers are credited with the ticks since the last sample
+            amount = 'ticks'
+            statements = [f'credit_tracker({to_scarpet(tracker.id)}, player, ticks)']
+            if deltas:
+                statements.append(f'apply_scaled_scoreboard_deltas({to_scarpet(deltas)}, player, ticks)')
+        stateful = self.stateful_scoreboards(tracker)
+        if stateful:
+            statements.append(f'update_stateful_scoreboards({to_scarpet(stateful)}, {to_scarpet(tracker.id)}, '
+                              f'player, {amount})')
+        count = statements[0] if len(statements) == 1 else f'({"; ".join(statements)})'
+        comment = f'// {tracker.id}' if dimension == ANY_DIMENSION else f'// {tracker.id} in {dimension}'
+        lines = [comment, f'{tracker_function_name(tracker.id, dimension)}({matcher_parameters(tracker.type)}) -> (']
+        tracker_bounds = bounds_condition(area, known)
+        if self.stats:
+            return '\n'.join(lines + self._instrumented_tracker_body(tracker, area, tracker_bounds, count) + [');'])
+        conditions = []
+        for component in tracker.script_components():
+            condition = bounds_condition(component.area, area)
+            block = self.block_condition(component.block_type.to_script())
+            if block is not None:
+                condition.append(block)
+            conditions.append(' && '.join(condition) or 'true')
+        if tracker.mode == 'union':
+            if 'true' in conditions:
+                body = [f'    {count};']
+            elif len(conditions) == 1:
+                body = [f'    if({conditions[0]}, {count});']
+            else:
+                body = [f'    if({" || ".join(f"({condition})" for condition in conditions)}, {count});']
+        else:
+            body = [f'    if({condition}, {count});' if condition != 'true' else f'    {count};'
+                    for condition in conditions]
+        if tracker_bounds:
+            lines.append(f'    if(!({" && ".join(tracker_bounds)}), return());')
+        lines += body
+        lines.append(');')
+        return '\n'.join(lines)
+
+    def _instrumented_tracker_body(self, tracker: 'Tracker', area: Area, tracker_bounds: List[str],
+                                   count: str) -> List[str]:
+        '''
+        the same checks one component at a time, counting which stage rejected the event
+        '''
+        lines = [f'    {stat_increment(f"t {tracker.id} checks")};']
+        if tracker_bounds:
+            lines.append(f'    if(!({" && ".join(tracker_bounds)}), '
+                         f'({stat_increment(f"t {tracker.id} area_rejects")}; return()));')
+        for component in tracker.script_components():
+            prefix = f'c {tracker.id} {component.id} '
+            branches = []
+            bounds = bounds_condition(component.area, area)
+            if bounds:
+                branches += [f'!({" && ".join(bounds)})', stat_increment(prefix + 'area_rejects')]
+            block = self.block_condition(component.block_type.to_script())
+            if block is not None:
+                branches += [f'!({block})', stat_increment(prefix + 'block_rejects')]
+            matched = f'{stat_increment(prefix + "matches")}; {count}'
+            if tracker.mode == 'union':
+                matched += '; return()'
+            lines.append(f'    {stat_increment(prefix + "checks")};')
+            if branches:
+                lines.append(f'    if({", ".join(branches)}, ({matched}));')
+            else:
+                lines.append(f'    {matched};')
+        return lines
+
+    def compile_statements(self) -> Dict[str, str]:
+        '''
+        the generated top level statements by the global or function they define, globals first
+
+        each of them can be sent on its own to redefine that part of a loaded script
+        '''
+        dispatch: Dict[str, str] = {}
+        functions: Dict[str, str] = {}
+        # tracker type -> dimension -> matcher, the script falls back to ANY_DIMENSION
+        matchers: Dict[str, Dict[str, str]] = {}
+        for tracker_type, partitions in plan_partitions(self.tracker_registry.trackers).items():
+            parameters = matcher_parameters(tracker_type)
+            for dimension, groups in partitions.items():
+                matcher = matcher_function_name(tracker_type, dimension)
+                matchers.setdefault(tracker_type, {})[dimension] = matcher
+                # chunk key -> tracker functions with a component in it, see Tracker.index_chunks
+                chunks: Dict[str, List[str]] = {}
+                unbounded: List[str] = []
+                for group in groups.values():
+                    for tracker in group.trackers:
+                        function = tracker_function_name(tracker.id, dimension)
+                        # the chunk doesn't bound y nor the group, the function checks all of the tracker bounds
+                        functions[function] = self.compile_tracker(tracker, None, dimension)
+                        tracker_chunks = tracker.index_chunks()
+                        if tracker_chunks is None:
+                            unbounded.append(function)
+                        else:
+                            for chunk in tracker_chunks:
+                                chunks.setdefault(chunk, []).append(function)
+                chunks_global, unbounded_global = dispatch_global_names(tracker_type, dimension)
+                dispatch[chunks_global] = f'{chunks_global} = {to_scarpet(chunks)};'
+                dispatch[unbounded_global] = f'{unbounded_global} = {to_scarpet(unbounded)};'
+                if tracker_type in TIME_TRACKER_TYPES:
+                    lines = [f'{matcher}(player, ticks) -> (',
+                             "    [x, y, z] = player~'pos';"]
+                else:
+                    lines = [f'{matcher}(player, block) -> (',
+                             "    [x, y, z] = player~'pos';",
+                             '    name = str(block);']
+                if unbounded:
+                    lines.append(f'    for({unbounded_global}, call(_, {parameters}));')
+                if chunks:
+                    lines += [f"    trackers = {chunks_global}:str('%d,%d', floor(x/16), floor(z/16));",
+                              f'    if(trackers != null, for(trackers, call(_, {parameters})));']
+                lines.append(');')
+                functions[matcher] = '\n'.join(lines)
+        statements = {'global_compiled_matchers': f'global_compiled_matchers = {to_scarpet(matchers)};'}
+        statements.update(dispatch)
+        statements.update(self._block_definitions)
+        statements.update(functions)
+        return statements
+
+    def compile(self) -> str:
+        '''
+        the generated section, appended to CARPET_SCRIPT
+        '''
+        return render_statements(self.compile_statements())
+
+
+def render_statements(statements: Dict[str, str]) -> str:
+    globals_ = [code for name, code in statements.items() if name.startswith('global_')]
+    functions = [code for name, code in statements.items() if not name.startswith('global_')]
+    header = ['// Compiled trackers, generated by the plugin from the current configuration'] + globals_
+    return '\n\n'.join(['\n'.join(header)] + functions)
+
+
+def statement_command(code: str) -> str:
+    '''
+    a statement as a single line, to be run in the loaded script
+    '''
+    lines = [line.strip() for line in code.split('\n')]
+    return ' '.join(line for line in lines if line and not line.startswith('//'))
+
+
+def compile_script(tracker_registry: 'TrackerRegistry', scoreboard_registry: 'ScoreboardRegistry',
+                   tracker_index: Optional[Dict[str, Dict[str, int]]] = None) -> str:
+    '''
+    CARPET_SCRIPT with the trackers compiled into it
+    '''
+    return render_script(ScriptCompiler(tracker_registry, scoreboard_registry, tracker_index).compile_statements())
+
+
+def render_script(statements: Dict[str, str]) -> str:
+    return CARPET_SCRIPT + '\n\n' + render_statements(statements) + '\n'
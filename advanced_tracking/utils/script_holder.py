@@ -1,50 +1,146 @@
 CARPET_SCRIPT = """global_DATA_PATH = 'advanced_tracking/';
+// ticks between two flushes of the tracking data, 0 or less writes on every change
+global_flush_interval = 100;
+global_dirty_players = {};
+global_known_players = {};
+// raw block events are appended to the journal, so new or edited trackers can be backfilled
+global_journal_events = true;
+global_journal = [];
+// the journal is split into numbered segments in journal/, see flush_journal
+global_journal_segment = 0;
+global_journal_segment_events = 0;
+global_journal_segment_size = 100000;
+global_journal_max_segments = 10;
+// tracker type -> name of the matcher function, set by the compiled section the plugin may append
+global_compiled_matchers = null;
+// counters dumped to stats.json, keys are '<kind> <ids...> <counter>', see stats.py
+global_stats_enabled = false;
+global_stats = {};
+// one event in this many is timed
+global_stats_sample = 50;
+global_stats_dump_interval = 200;
+// non-AFK time: online players are sampled every global_active_time_interval ticks, and are AFK once they
+// haven't moved or turned for global_afk_timeout ticks
+global_active_time_interval = 20;
+global_afk_timeout = 3600;
+// uuid -> [x, y, z, yaw, pitch] at the last sample, and uuid -> tick they were last seen active
+global_last_poses = {};
+global_last_active = {};
+// tracker id -> uuid -> count of a tracker being backfilled when the journal was marked, or when the player was
+// loaded after that. What is counted on top of it is added to the backfilled counts, see begin_backfill
+global_backfill_bases = {};
+// objective -> uuid -> what a scoreboard in a mode other than weighted_sum keeps to update an online player's
+// score without going over all its trackers, see scoreboard_state
+global_scoreboard_state = {};
 
 
 // Tracking System
 
+// trackers.json: tracker type -> dimension partition -> group -> trackers, and 'index' with the same partitions
+// it may be compact: empty areas, default modes and empty maps are left out,
+// and components refer to block type filters shared in 'block_types' by their position
 load_trackers(path) ->(
     if(slice(path, length(path)-1) != '/', path += '/');
     global_trackers = read_file(path + 'trackers', 'shared_json');
+    if(global_trackers == null, global_trackers = {});
 );
 
+// player records are loaded when the player connects and evicted after they leave,
+// so only online players are held in memory
 load_data(path) ->(
-    if(slice(path, length(path)-1) != '/', path += '/');
     global_tracking_data = {};
-    data_path = path + 'tracked_data/';
-    file_lst = list_files(data_path, 'shared_json');
-    // print(file_lst);
-    for(file_lst, (
-        player_file_path = _;
-        player_uuid = slice(player_file_path, length(data_path));
-        // print(player_file_path);
-        // print(length(data_path));
-        // print(player_uuid);
-        global_tracking_data:player_uuid = read_file(player_file_path, 'shared_json');
-    ));
+    for(player('all'), load_player_data(_, path));
 );
 
-save_data(path, players=null) -> (
+load_player_data(player, path=null) -> (
+    if(path==null, path = global_DATA_PATH);
+    if(slice(path, length(path)-1) != '/', path += '/');
+    uuid = player~'uuid';
+    if(has(global_tracking_data, uuid), return());
+    data = read_file(path + 'tracked_data/' + uuid, 'shared_json');
+    if(data != null, global_tracking_data:uuid = data);
+    for(global_backfill_bases, if(!has(global_backfill_bases:_, uuid), global_backfill_bases:_:uuid = tracker_count(data, _)));
+);
+
+tracker_count(data, tracker_id) -> (
+    count = if(data == null, null, data:'trackers':tracker_id);
+    if(count == null, 0, count)
+);
+
+evict_player_data(uuid) -> (
+    flush_player_data(uuid);
+    delete(global_tracking_data, uuid);
+);
+
+save_data(path, uuids=null) -> (
     if(slice(path, length(path)-1) != '/', path += '/');
     data_path = path + 'tracked_data/';
-    if(players==null, players = global_tracking_data);
-    for(players, (
-        uuid=_~'uuid';
+    if(uuids==null, uuids = keys(global_tracking_data));
+    for(uuids, (
+        uuid=_;
         // print('saving + '+uuid);
         write_file(data_path+uuid, 'shared_json', global_tracking_data:uuid)
     ));
 );
 
-check_block_in_list(block, list) -> (
-    // print(block);
-    // print(list);
-    if(list~(block+'')==null, return(false));
-    requirements = list:(block+'');
-    for(requirements, (
+// Write-behind buffering: changed players are only marked dirty, and written on the next flush
+
+flush_data() -> (
+    save_data(global_DATA_PATH, keys(global_dirty_players));
+    global_dirty_players = {};
+    flush_journal();
+);
+
+flush_player_data(uuid) -> (
+    if(has(global_dirty_players, uuid), (
+        save_data(global_DATA_PATH, [uuid]);
+        delete(global_dirty_players, uuid);
+    ));
+);
+
+set_flush_interval(ticks) -> (
+    global_flush_interval = ticks;
+    if(ticks <= 0, flush_data());
+);
+
+// settings.json is written by the plugin from its config
+load_settings(path) -> (
+    if(slice(path, length(path)-1) != '/', path += '/');
+    settings = read_file(path + 'settings', 'shared_json');
+    if(settings == null, return());
+    if(settings:'flush_interval' != null, set_flush_interval(settings:'flush_interval'));
+    if(settings:'journal_events' != null, global_journal_events = settings:'journal_events');
+    if(settings:'journal_segment_events' != null, global_journal_segment_size = max(1, settings:'journal_segment_events'));
+    if(settings:'journal_max_segments' != null, global_journal_max_segments = max(1, settings:'journal_max_segments'));
+    if(settings:'collect_stats' != null, global_stats_enabled = settings:'collect_stats');
+    if(settings:'active_time_interval' != null, global_active_time_interval = max(1, settings:'active_time_interval'));
+    if(settings:'afk_timeout' != null, global_afk_timeout = settings:'afk_timeout');
+);
+
+mark_dirty(uuid) -> (
+    if(global_flush_interval > 0,
+        global_dirty_players:uuid = true,
+        save_data(global_DATA_PATH, [uuid])
+    );
+);
+
+// filter: compiled block type filter, see BlockTypes.to_script
+check_block_in_list(block, filter) -> (
+    name = str(block);
+    names = filter:'names';
+    if(names != null && has(names, name), return(true));
+    states = filter:'states';
+    if(states == null, return(false));
+    spec = states:name;
+    if(spec == null, return(false));
+    // query every needed state once
+    state = {};
+    for(spec:'keys', state:_ = str(block_state(block, _)));
+    for(spec:'requirements', (
         requirement = _;
         flag = true;
         for(requirement, (
-            if(block_state(block, _) != requirement:_, (flag=false; break()));
+            if(state:_ != requirement:_, (flag=false; break()));
         ));
         if(flag, return(true));
     ));
@@ -54,6 +150,7 @@ check_block_in_list(block, list) -> (
 check_player_in_area(pos, area) -> (
     // print(pos);
     // print(area);
+    if(area == null, return(true));
     [x, y, z] = pos;
     if(area:'x_min' != null, if(area:'x_min' > x, return(false)));
     if(area:'x_max' != null, if(area:'x_max' < x, return(false)));
@@ -67,60 +164,327 @@ check_player_in_area(pos, area) -> (
     return(true);
 );
 
-check_block_interaction_match_component(component, player, block) -> (
+check_block_interaction_match_component(component, pos, block) -> (
+    component_reject_stage(component, pos, block) == null
+);
+
+// 'area' or 'block' for the check that rejected the event, null if the component matches
+component_reject_stage(component, pos, block) -> (
     // check area
-    if(!check_player_in_area(player~'pos', component:'area'), return(false));
+    if(!check_player_in_area(pos, component:'area'), return('area'));
     
     block_type_restrictions = component:'block_type';
+    if(block_type_restrictions == null, return(null));
+    if(type(block_type_restrictions) == 'number', block_type_restrictions = global_trackers:'block_types':block_type_restrictions);
 
-    if(block_type_restrictions:'mode'=='whitelist', if(check_block_in_list(block, block_type_restrictions:'list')==false, return(false)));
-    if(block_type_restrictions:'mode'=='blacklist', if(check_block_in_list(block, block_type_restrictions:'list'), return(false)));
+    if(block_type_restrictions:'mode'=='whitelist', if(check_block_in_list(block, block_type_restrictions)==false, return('block')));
+    if(block_type_restrictions:'mode'=='blacklist', if(check_block_in_list(block, block_type_restrictions), return('block')));
 
-    return(true);
+    return(null);
 );
 
 increment_tracker(tracker_name, player) -> (
-    // global_tracking_data:(player ~ 'uuid'):'trackers':tracker_name += 1;
-    print(player ~ 'uuid');
-    print(global_tracking_data:(player ~ 'uuid'));
-    global_tracking_data:(player ~ 'uuid'):'trackers':tracker_name += 1;
-    save_data(global_DATA_PATH, [player]);
+    uuid = player ~ 'uuid';
+    if(global_tracking_data:uuid == null, (load_player_data(player); check_player_profile(player)));
+    global_tracking_data:uuid:'trackers':tracker_name += 1;
+    mark_dirty(uuid);
 );
 
-update_block_tracker(player, block, tracker_type) -> (
-    //iterate through groups
-    for(global_trackers:tracker_type, (
-        group = global_trackers:tracker_type:_;
-        // print('group ' + group);
-        if(!check_player_in_area(player~'pos', group:'area'), continue());
-        // print('group area check passed');
-        for(group:'trackers', (
+credit_tracker(tracker_name, player, amount) -> (
+    uuid = player ~ 'uuid';
+    if(global_tracking_data:uuid == null, (load_player_data(player); check_player_profile(player)));
+    global_tracking_data:uuid:'trackers':tracker_name += amount;
+    mark_dirty(uuid);
+);
+
+// candidates: group_id -> tracker_id -> [component_id], taken from the spatial index of the partition of groups
+// amount: 1 for a block event, the sampled ticks for time trackers
+match_candidates(player, block, pos, tracker_type, groups, candidates, amount) -> (
+    if(candidates == null, return());
+    stats = global_stats_enabled;
+    for(candidates, (
+        group_id = _;
+        group = groups:group_id;
+        if(stats, global_stats:('g ' + tracker_type + ' ' + group_id + ' checks') += 1);
+        if(!check_player_in_area(pos, group:'area'), (
+            if(stats, global_stats:('g ' + tracker_type + ' ' + group_id + ' rejects') += 1);
+            continue()
+        ));
+        for(candidates:group_id, (
             tracker_id = _;
             tracker = group:'trackers':tracker_id;
-            // print(tracker);
-            if(!check_player_in_area(player~'pos', tracker:'area'), continue());
-            for(tracker:'components', (
-                component = tracker:'components':_;
-                if(check_block_interaction_match_component(component, player, block), (
-                    increment_tracker(tracker_id, player);
-                    update_scoreboards(tracker:'scoreboards', player);
-                    if(tracker:'mode' == 'union', break);
+            if(stats, global_stats:('t ' + tracker_id + ' checks') += 1);
+            if(!check_player_in_area(pos, tracker:'area'), (
+                if(stats, global_stats:('t ' + tracker_id + ' area_rejects') += 1);
+                continue()
+            ));
+            for(candidates:group_id:tracker_id, (
+                component_id = _;
+                component = tracker:'components':component_id;
+                if(stats, (
+                    key = 'c ' + tracker_id + ' ' + component_id + ' ';
+                    global_stats:(key + 'checks') += 1;
+                    stage = component_reject_stage(component, pos, block);
+                    if(stage != null, global_stats:(key + stage + '_rejects') += 1, global_stats:(key + 'matches') += 1);
+                    matched = stage == null
+                ),
+                    matched = check_block_interaction_match_component(component, pos, block)
+                );
+                if(matched, (
+                    credit_tracker(tracker_id, player, amount);
+                    apply_scaled_scoreboard_deltas(tracker:'scoreboards', player, amount);
+                    update_stateful_scoreboards(tracker:'stateful_scoreboards', tracker_id, player, amount);
+                    if(tracker:'mode' != 'sum', break());
                 ));
             ))
         ))
     ));
 );
 
+update_block_tracker(player, block, tracker_type) -> (
+    if(global_compiled_matchers != null, (
+        matcher = compiled_matcher(tracker_type, player~'dimension');
+        if(matcher != null, call(matcher, player, block));
+        return();
+    ));
+    match_indexed(player, block, player~'pos', tracker_type, 1);
+);
+
+// trackers are partitioned by dimension, the '*' partition holds those for every dimension without its own
+dimension_partition(partitions, dimension) -> (
+    if(has(partitions, dimension), dimension, '*')
+);
+
+compiled_matcher(tracker_type, dimension) -> (
+    matchers = global_compiled_matchers:tracker_type;
+    if(matchers == null, return(null));
+    matchers:(dimension_partition(matchers, dimension))
+);
+
+match_indexed(player, block, pos, tracker_type, amount) -> (
+    partitions = global_trackers:'index':tracker_type;
+    if(partitions == null, return());
+    partition = dimension_partition(partitions, player~'dimension');
+    index = partitions:partition;
+    if(index == null, return());
+    groups = global_trackers:tracker_type:partition;
+    [x, y, z] = pos;
+    // unbucketed trackers first, then only the ones indexed under the player's chunk
+    match_candidates(player, block, pos, tracker_type, groups, index:'global', amount);
+    chunks = index:'chunks';
+    if(chunks != null, match_candidates(player, block, pos, tracker_type, groups, chunks:str('%d,%d', floor(x/16), floor(z/16)), amount));
+);
+
+// Non-AFK time
+// one pass over the online players, crediting the player_active_time trackers they are in with the ticks since
+// the last sample. Looking around counts as activity, moving only when not riding, as vehicles and water
+// streams move AFK players too
+
+sample_active_time() -> (
+    compiled = global_compiled_matchers != null;
+    if(if(compiled, global_compiled_matchers:'player_active_time', global_trackers:'index':'player_active_time') == null,
+        return()
+    );
+    ticks = global_active_time_interval;
+    now = tick_time();
+    stats = global_stats_enabled;
+    for(player('all'), (
+        player = _;
+        uuid = player~'uuid';
+        pos = player~'pos';
+        [x, y, z] = pos;
+        pose = [x, y, z, player~'yaw', player~'pitch'];
+        last = global_last_poses:uuid;
+        global_last_poses:uuid = pose;
+        if(last == null, (
+            // just joined, nothing to compare against yet
+            global_last_active:uuid = now;
+            continue()
+        ));
+        [last_x, last_y, last_z, last_yaw, last_pitch] = last;
+        if(abs(pose:3 - last_yaw) + abs(pose:4 - last_pitch) > 0.01
+                || (player~'mount' == null && abs(x - last_x) + abs(y - last_y) + abs(z - last_z) > 0.01),
+            global_last_active:uuid = now
+        );
+        if(now - global_last_active:uuid >= global_afk_timeout, continue());
+        if(stats, global_stats:'e player_active_time events' += 1);
+        if(compiled, (
+            matcher = compiled_matcher('player_active_time', player~'dimension');
+            if(matcher != null, call(matcher, player, ticks))
+        ),
+            match_indexed(player, null, pos, 'player_active_time', ticks)
+        );
+    ));
+);
+
+// Event journal
+// one line per event: <b|p> <uuid> <dimension> <x> <y> <z> <block> <state>, with the player position at full
+// precision, so backfill.py compares the same values as the matching here, and the block state as
+// key=value;key=value, or - if the block has none. Read by backfill.py
+// every segment starts with s <unix time in ms>, m <marker> lines are written by begin_backfill
+
+journal_event(player, block, code) -> (
+    if(!global_journal_events, return());
+    state = block_state(block);
+    state_str = if(length(state) == 0, '-', join(';', map(pairs(state), _:0 + '=' + _:1)));
+    [x, y, z] = player~'pos';
+    put(global_journal, null, str('%s %s %s %.17g %.17g %.17g %s %s', code, player~'uuid', player~'dimension', x, y, z, str(block), state_str));
+    if(global_flush_interval <= 0, flush_journal());
+);
+
+// a new segment is started on every load and every global_journal_segment_size lines, and only the last
+// global_journal_max_segments are kept, older events can't be backfilled anymore
+flush_journal() -> (
+    if(length(global_journal) == 0, return());
+    if(global_journal_segment_events == 0, put(global_journal, 0, str('s %d', unix_time()), 'insert'));
+    write_file(global_DATA_PATH + 'journal/' + global_journal_segment, 'shared_text', global_journal);
+    global_journal_segment_events += length(global_journal);
+    global_journal = [];
+    if(global_journal_segment_events >= global_journal_segment_size, (
+        global_journal_segment += 1;
+        global_journal_segment_events = 0;
+        prune_journal();
+    ));
+);
+
+journal_segments() -> (
+    filter(map(list_files(global_DATA_PATH + 'journal', 'shared_text'), number(split('/', _):(-1))), _ != null)
+);
+
+init_journal() -> (
+    segments = journal_segments();
+    global_journal_segment = if(length(segments) == 0, 0, max(segments) + 1);
+    global_journal_segment_events = 0;
+    prune_journal();
+);
+
+prune_journal() -> (
+    oldest = global_journal_segment - global_journal_max_segments;
+    for(journal_segments(), if(_ <= oldest, delete_file(global_DATA_PATH + 'journal/' + _, 'shared_text')));
+);
+
+// the plugin counts the journal up to the marker line written here, the events after it are counted live on top
+// of the counts kept here
+begin_backfill(tracker_id, marker) -> (
+    put(global_journal, null, 'm ' + marker);
+    flush_data();
+    base = {};
+    for(global_tracking_data, base:_ = tracker_count(global_tracking_data:_, tracker_id));
+    global_backfill_bases:tracker_id = base;
+);
+
+backfill_delta(base, uuid, data, tracker_id) -> (
+    if(has(base, uuid), tracker_count(data, tracker_id) - base:uuid, 0)
+);
+
+// backfill/<tracker_id>.json holds uuid -> count computed by the plugin from the journal, without it the backfill
+// is only ended
+apply_backfill(tracker_id) -> (
+    base = global_backfill_bases:tracker_id;
+    if(base == null, base = {});
+    delete(global_backfill_bases, tracker_id);
+    backfill_path = global_DATA_PATH + 'backfill/' + tracker_id;
+    counts = read_file(backfill_path, 'shared_json');
+    if(counts == null, return());
+    data_path = global_DATA_PATH + 'tracked_data/';
+    for(counts, (
+        uuid = _;
+        if(global_tracking_data:uuid != null, (
+            data = global_tracking_data:uuid;
+            data:'trackers':tracker_id = counts:uuid + backfill_delta(base, uuid, data, tracker_id);
+            mark_dirty(uuid);
+        ), (
+            // offline player, update the file and its scores by name
+            data = read_file(data_path + uuid, 'shared_json');
+            if(data != null, (
+                data:'trackers':tracker_id = counts:uuid + backfill_delta(base, uuid, data, tracker_id);
+                write_file(data_path + uuid, 'shared_json', data);
+                for(global_scoreboards, update_scoreboard_from_counts(_, data:'player_ID', data:'trackers'));
+            ));
+        ));
+    ));
+    delete_file(backfill_path, 'shared_json');
+    for(player('all'), recompute_scoreboards(_));
+);
+
+// Live patches
+// patches/<name>.json: {"trackers": [[keys, value], ...], "scoreboards": [[keys, value], ...]}, written by the plugin
+// from a diff of the data it injected last, so a small edit doesn't reload the whole file. A null value deletes the
+// key. Every patch has its own file, so one written before the previous is applied doesn't replace it
+
+apply_patch_ops(root, ops) -> (
+    for(ops, (
+        [keys, value] = _;
+        node = root;
+        for(slice(keys, 0, length(keys)-1), (
+            if(node:_ == null, node:_ = {});
+            node = node:_;
+        ));
+        last = keys:(-1);
+        if(value == null, delete(node, last), node:last = value);
+    ));
+);
+
+apply_patch(path, name) -> (
+    if(slice(path, length(path)-1) != '/', path += '/');
+    patch_path = path + 'patches/' + name;
+    patch = read_file(patch_path, 'shared_json');
+    if(patch == null, return());
+    if(patch:'trackers' != null, apply_patch_ops(global_trackers, patch:'trackers'));
+    ops = patch:'scoreboards';
+    if(ops != null, (
+        apply_patch_ops(global_scoreboards, ops);
+        // objectives whose entry changed
+        touched = {};
+        for(ops, touched:(_:0:0) = true);
+        for(touched, if(has(global_scoreboards, _), init_scoreboard(_)));
+        for(player('all'), recompute_scoreboards(_))
+    ));
+    delete_file(patch_path, 'shared_json');
+);
+
+// Statistics
+
+// update_block_tracker, timing one event in global_stats_sample
+timed_update_block_tracker(player, block, tracker_type) -> (
+    key = 'e ' + tracker_type + ' ';
+    global_stats:(key + 'events') += 1;
+    if(global_stats:(key + 'events') % global_stats_sample != 0, return(update_block_tracker(player, block, tracker_type)));
+    start = time();
+    update_block_tracker(player, block, tracker_type);
+    global_stats:(key + 'time') += time() - start;
+    global_stats:(key + 'timed') += 1;
+);
+
+dump_stats() -> (
+    write_file(global_DATA_PATH + 'stats', 'shared_json', {'tick' -> tick_time(), 'counters' -> global_stats});
+);
+
+reset_stats() -> (
+    global_stats = {};
+    dump_stats();
+);
+
+// uuids of every player with a profile in tracked_data/, listed once on start
+load_known_players(path) -> (
+    if(slice(path, length(path)-1) != '/', path += '/');
+    data_path = path + 'tracked_data/';
+    global_known_players = {};
+    for(list_files(data_path, 'shared_json'), global_known_players:(slice(_, length(data_path))) = true);
+);
+
 check_player_profile(player, path=null) -> (
     if(path==null, path = global_DATA_PATH);
     if(slice(path, length(path)-1) != '/', path += '/');
     data_path = path + 'tracked_data/';
-    if(list_files(data_path, 'shared_json') ~ (data_path + player~'uuid') == null, (
-        write_file(data_path + (player~'uuid'), 'shared_json', {'player_ID'-> player, 'trackers'->{}});
-        global_tracking_data:(player~'uuid') = {'player_ID'-> player, 'trackers'->{}}
-    ), 
-    globa_tracking_data:(player~'uuid'):'player_ID' = player;
-    )
+    uuid = player~'uuid';
+    if(!has(global_known_players, uuid), (
+        global_tracking_data:uuid = {'player_ID'-> player~'name', 'trackers'->{}};
+        write_file(data_path + uuid, 'shared_json', global_tracking_data:uuid);
+        global_known_players:uuid = true;
+    ), global_tracking_data:uuid != null,
+        global_tracking_data:uuid:'player_ID' = player~'name'
+    );
 );
 
 
@@ -135,53 +499,237 @@ load_scoreboard(objective, display) -> (
 load_scoreboards(path) -> (
     if(slice(path, length(path)-1) != '/', path += '/');
     global_scoreboards = read_file(path + 'scoreboards', 'shared_json');
+    if(global_scoreboards == null, global_scoreboards = {});
+    global_scoreboard_state = {};
     //initialize and update displaynames for objectives
-    for(global_scoreboards, (
-        objective = _;
-        display = global_scoreboards:objective:'display_name';
-        load_scoreboard(objective, display);
-    ))
+    for(global_scoreboards, init_scoreboard(_));
+    for(player('all'), recompute_scoreboards(_))
 );
 
+init_scoreboard(objective) -> (
+    // fill in what compact data leaves out
+    if(global_scoreboards:objective:'mode' == null, global_scoreboards:objective:'mode' = 'weighted_sum');
+    total_weight = 0;
+    for(global_scoreboards:objective:'trackers', total_weight += _:'weight');
+    global_scoreboards:objective:'total_weight' = total_weight;
+    // rebuilt by the recompute following every (re)initialization
+    delete(global_scoreboard_state, objective);
+    display = global_scoreboards:objective:'display_name';
+    if(display == null, display = objective);
+    load_scoreboard(objective, display);
+);
+
+// full recompute of an objective from the stored counts, used when loading and to rebuild the state of a player
 update_scoreboard(objective, player) -> (
-    // print(objective);
-    // print(player);
-    scoreboard_config = global_scoreboards:objective;
-    if(scoreboard_config:'mode' == 'weighted_sum', (
-        acc=0.0;
+    uuid = player ~ 'uuid';
+    counts = global_tracking_data:uuid:'trackers';
+    if(counts == null, return());
+    state = update_scoreboard_from_counts(objective, player, counts);
+    if(state != null, (
+        if(global_scoreboard_state:objective == null, global_scoreboard_state:objective = {});
+        global_scoreboard_state:objective:uuid = state
+    ));
+);
+
+// target: a player, or the name of an offline player, returns the state of the score
+update_scoreboard_from_counts(objective, target, counts) -> (
+    [score, state] = scoreboard_state(global_scoreboards:objective, counts);
+    if(score != null, scoreboard(objective, target, score));
+    state
+);
+
+// [score, state] of a player, the state is null for weighted_sum, which is updated by deltas, and otherwise
+//   average, capped_sum: [sum of the (capped) weighted counts]
+//   max: [maximum, id of the tracker reaching it]
+//   min: [minimum, number of trackers at the minimum]
+// the score is null if the mode is unknown. Mirrored by compute_score in scoreboard.py
+scoreboard_state(scoreboard_config, counts) -> (
+    mode = scoreboard_config:'mode';
+    if(mode == 'max' || mode == 'min', (
+        best = null;
+        arg = null;
+        ties = 0;
         for(scoreboard_config:'trackers', (
-            tracker = _;
-            tracker_id=tracker:'tracker_id';
-            weight = tracker:'weight';
-            // print(tracker_id);
-            // print(weight);
-            acc += (global_tracking_data:(player ~ 'uuid'):'trackers':tracker_id)*weight;
+            count = counts:(_:'tracker_id');
+            if(count == null, count = 0);
+            value = count * _:'weight';
+            if(best == null || (mode == 'max' && value > best) || (mode == 'min' && value < best),
+                (best = value; arg = _:'tracker_id'; ties = 1),
+                value == best,
+                ties += 1
+            );
         ));
-        scoreboard(objective, player, acc)
-    ))
-    
+        if(best == null, best = 0);
+        return([best, [best, if(mode == 'max', arg, ties)]]);
+    ));
+    cap = if(mode == 'capped_sum', scoreboard_config:'cap');
+    acc = 0;
+    for(scoreboard_config:'trackers', (
+        count = counts:(_:'tracker_id');
+        if(count == null, count = 0);
+        value = count * _:'weight';
+        if(cap != null && value > cap, value = cap);
+        acc += value;
+    ));
+    if(mode == 'weighted_sum', [acc, null],
+        mode == 'capped_sum', [acc, [acc]],
+        mode == 'average', [average_score(acc, scoreboard_config), [acc]],
+        [null, null]
+    )
+);
+
+average_score(sum, scoreboard_config) -> (
+    total_weight = scoreboard_config:'total_weight';
+    if(total_weight == null || total_weight == 0, 0, floor(sum / total_weight))
+);
+
+// objectives: objective -> weight of the tracker, which was just credited with amount
+// updates the score from the state kept for the player, only max and min may need to go over the trackers again,
+// when the tracker at the maximum decreases (negative weight) or the last one at the minimum leaves it
+update_stateful_scoreboards(objectives, tracker_id, player, amount) -> (
+    if(objectives == null, return());
+    uuid = player~'uuid';
+    count = global_tracking_data:uuid:'trackers':tracker_id;
+    for(objectives, (
+        objective = _;
+        scoreboard_config = global_scoreboards:objective;
+        if(scoreboard_config == null, continue());
+        state = global_scoreboard_state:objective:uuid;
+        if(state == null, (
+            update_scoreboard(objective, player);
+            continue()
+        ));
+        weight = objectives:objective;
+        value = count * weight;
+        previous = (count - amount) * weight;
+        mode = scoreboard_config:'mode';
+        if(mode == 'average', (
+            state:0 = state:0 + value - previous;
+            scoreboard(objective, player, average_score(state:0, scoreboard_config))
+        ), mode == 'capped_sum', (
+            cap = scoreboard_config:'cap';
+            if(cap != null, (
+                if(value > cap, value = cap);
+                if(previous > cap, previous = cap)
+            ));
+            state:0 = state:0 + value - previous;
+            scoreboard(objective, player, state:0)
+        ), mode == 'max', (
+            if(value > state:0, (
+                state:0 = value;
+                state:1 = tracker_id;
+                scoreboard(objective, player, value)
+            ), state:1 == tracker_id && value < previous,
+                update_scoreboard(objective, player)
+            )
+        ), mode == 'min', (
+            if(value < state:0, (
+                state:0 = value;
+                state:1 = 1;
+                scoreboard(objective, player, value)
+            ), previous == state:0 && value != previous, (
+                // left the minimum
+                state:1 = state:1 - 1;
+                if(state:1 <= 0, update_scoreboard(objective, player))
+            ), value == state:0 && previous != value,
+                state:1 = state:1 + 1
+            )
+        ));
+    ));
 );
 
 update_scoreboards(objectives, player) -> (
     for(objectives, update_scoreboard(_, player))
 );
 
+recompute_scoreboards(player) -> (
+    update_scoreboards(keys(global_scoreboards), player)
+);
+
+// scores: player name -> score, a batch of a rebuild computed by the plugin from the files in tracked_data/
+// online players are left to recompute_objective, their counts in memory may be ahead of their files
+set_scores(objective, scores) -> (
+    if(!has(global_scoreboards, objective), return());
+    for(scores, if(player(_) == null, scoreboard(objective, _, scores:_)));
+);
+
+recompute_objective(objective) -> (
+    if(!has(global_scoreboards, objective), return());
+    for(player('all'), update_scoreboard(objective, _));
+);
+
+// deltas: objective -> weight of the counted tracker
+apply_scoreboard_deltas(deltas, player) -> (
+    if(deltas == null, return());
+    for(deltas, (
+        objective = _;
+        current = scoreboard(objective, player);
+        if(current == null, current = 0);
+        scoreboard(objective, player, current + deltas:objective)
+    ))
+);
+
+apply_scaled_scoreboard_deltas(deltas, player, amount) -> (
+    if(deltas == null, return());
+    for(deltas, (
+        objective = _;
+        current = scoreboard(objective, player);
+        if(current == null, current = 0);
+        scoreboard(objective, player, current + deltas:objective * amount)
+    ))
+);
+
 
 __on_start() -> (
+    load_settings(global_DATA_PATH);
+    init_journal();
     load_trackers(global_DATA_PATH);
+    load_known_players(global_DATA_PATH);
     load_data(global_DATA_PATH);
     load_scoreboards(global_DATA_PATH);
     for(player('all'), check_player_profile(_, global_DATA_PATH))
 );
 
 __on_player_breaks_block(player, block)-> (
-    update_block_tracker(player, block, 'player_break_blocks');
+    journal_event(player, block, 'b');
+    if(global_stats_enabled,
+        timed_update_block_tracker(player, block, 'player_break_blocks'),
+        update_block_tracker(player, block, 'player_break_blocks')
+    );
 );
 
 __on_player_places_block(player, item_tuple, hand, block)->(
-    update_block_tracker(player, block, 'player_place_blocks');
+    journal_event(player, block, 'p');
+    if(global_stats_enabled,
+        timed_update_block_tracker(player, block, 'player_place_blocks'),
+        update_block_tracker(player, block, 'player_place_blocks')
+    );
 );
 
 __on_player_connects(player)-> (
+    load_player_data(player, global_DATA_PATH);
     check_player_profile(player, global_DATA_PATH);
+    recompute_scoreboards(player);
+);
+
+__on_player_disconnects(player, reason)-> (
+    uuid = player~'uuid';
+    evict_player_data(uuid);
+    delete(global_last_poses, uuid);
+    delete(global_last_active, uuid);
+    for(global_scoreboard_state, delete(global_scoreboard_state:_, uuid));
+);
+
+__on_tick()-> (
+    if(global_flush_interval > 0 && tick_time() % global_flush_interval == 0
+            && (length(global_dirty_players) > 0 || length(global_journal) > 0),
+        flush_data()
+    );
+    if(global_stats_enabled && tick_time() % global_stats_dump_interval == 0, dump_stats());
+    if(tick_time() % global_active_time_interval == 0, sample_active_time());
+);
+
+__on_close()-> (
+    flush_data();
+    if(global_stats_enabled, dump_stats());
 );"""
\ No newline at end of file
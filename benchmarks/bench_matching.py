@@ -0,0 +1,81 @@
+"""
+Event throughput of the reference evaluator as trackers, components and players scale
+
+Only the generic script reading trackers.json (compile_trackers off) is modelled, not the compiled matchers
+deployed by default.
+
+    python -m benchmarks.bench_matching [--quick] [--events N] [--output bench_output.txt]
+"""
+import argparse
+import json
+import time
+from typing import List, Tuple
+
+from advanced_tracking.utils.reference_evaluator import ReferenceEvaluator
+from benchmarks.synthetic import generate_events, generate_registries
+
+# (trackers, components per tracker, players)
+SCENARIOS: List[Tuple[int, int, int]] = [
+    (10, 4, 10),
+    (100, 4, 10),
+    (1000, 4, 10),
+    (100, 1, 10),
+    (100, 16, 10),
+    (100, 4, 1),
+    (100, 4, 100),
+]
+
+QUICK_SCENARIOS: List[Tuple[int, int, int]] = [
+    (10, 4, 10),
+    (100, 4, 10),
+]
+
+
+def run_scenario(trackers: int, components: int, players: int, events: int, compact: bool) -> dict:
+    tracker_registry, scoreboard_registry = generate_registries(trackers, components)
+    tracker_index = scoreboard_registry.tracker_index()
+    # round trip through json, so the evaluator sees exactly what the script would read
+    evaluator = ReferenceEvaluator(
+        json.loads(tracker_registry.to_script_json(scoreboard_registry, tracker_index, compact)),
+        json.loads(scoreboard_registry.to_script_json(tracker_index, compact))
+    )
+    event_list = list(generate_events(events, players, tracker_registry))
+    matches = 0
+    start = time.perf_counter()
+    for event in event_list:
+        matches += len(evaluator.process(event))
+    elapsed = time.perf_counter() - start
+    return {
+        "trackers": trackers,
+        "components": components,
+        "players": players,
+        "events": events,
+        "events_per_second": events / elapsed if elapsed > 0 else float("inf"),
+        "checks_per_event": evaluator.checks / events,
+        "matches_per_event": matches / events,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000, help="events per scenario")
+    parser.add_argument("--quick", action="store_true", help="only run the small scenarios")
+    parser.add_argument("--indented", action="store_true", help="use the indented instead of the compact json")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    lines = ["reference evaluator: generic trackers.json matching, the compiled matchers are not modelled",
+             f"{'trackers':>9} {'components':>11} {'players':>8} {'events/s':>12} {'checks/event':>13} {'matches/event':>14}"]
+    for trackers, components, players in (QUICK_SCENARIOS if args.quick else SCENARIOS):
+        result = run_scenario(trackers, components, players, args.events, not args.indented)
+        lines.append(f"{result['trackers']:>9} {result['components']:>11} {result['players']:>8} "
+                     f"{result['events_per_second']:>12.0f} {result['checks_per_event']:>13.2f} "
+                     f"{result['matches_per_event']:>14.3f}")
+        print(lines[-1] if len(lines) > 3 else "\n".join(lines), flush=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
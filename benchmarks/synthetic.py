@@ -0,0 +1,78 @@
+"""
+Synthetic trackers, scoreboards and block events for the benchmarks
+"""
+import random
+from typing import Iterator, List, Tuple
+
+from advanced_tracking.project_types import BlockTypes
+from advanced_tracking.scoreboard import Scoreboard, ScoreboardRegistry
+from advanced_tracking.tracker import Tracker, TrackerComponent, TrackerRegistry
+from advanced_tracking.utils.reference_evaluator import BlockEvent
+
+BLOCKS: List[str] = ["stone", "dirt", "obsidian", "netherrack", "smooth_stone_slab", "glass", "sand", "gravel"]
+TRACKER_TYPES: List[str] = ["player_break_blocks", "player_place_blocks"]
+
+
+def generate_registries(trackers: int, components: int, world_size: int = 4096, project_size: int = 64,
+                        seed: int = 0) -> Tuple[TrackerRegistry, ScoreboardRegistry]:
+    '''
+    trackers spread over projects in a world_size x world_size square, each with the given number of
+    cuboid components inside its project, half of them with a block filter
+
+    every tracker gets a dedicated scoreboard, and there is one total scoreboard of all of them
+    '''
+    rng = random.Random(seed)
+    tracker_registry = TrackerRegistry()
+    scoreboard_registry = ScoreboardRegistry()
+    total = Scoreboard(id="total")
+    for t in range(trackers):
+        px = rng.randrange(-world_size // 2, world_size // 2)
+        pz = rng.randrange(-world_size // 2, world_size // 2)
+        tracker = Tracker(id=f"tracker_{t}", type=rng.choice(TRACKER_TYPES), mode=rng.choice(["union", "sum"]))
+        for c in range(components):
+            x1, x2 = sorted(rng.randrange(px, px + project_size) for _ in range(2))
+            z1, z2 = sorted(rng.randrange(pz, pz + project_size) for _ in range(2))
+            y1, y2 = sorted(rng.randrange(-64, 320) for _ in range(2))
+            block_type = BlockTypes()
+            if rng.random() < 0.5:
+                block_type = BlockTypes(mode=rng.choice(["whitelist", "blacklist"]),
+                                        list={block: [{}] for block in rng.sample(BLOCKS, 2)})
+                if rng.random() < 0.25:
+                    block_type.list["smooth_stone_slab"] = [{"type": "top"}, {"type": "bottom", "waterlogged": True}]
+            tracker.add_component(TrackerComponent(
+                id=f"component_{c}",
+                area={"x_min": x1, "x_max": x2, "y_min": y1, "y_max": y2, "z_min": z1, "z_max": z2},
+                block_type=block_type
+            ))
+        tracker_registry.add(tracker)
+        scoreboard = Scoreboard(id=f"sb_{t}")
+        scoreboard.add_tracker(tracker.id)
+        scoreboard_registry.add(scoreboard)
+        total.add_tracker(tracker.id, rng.randint(1, 3))
+    scoreboard_registry.add(total)
+    return tracker_registry, scoreboard_registry
+
+
+def generate_events(count: int, players: int, tracker_registry: TrackerRegistry, world_size: int = 4096,
+                    near_project: float = 0.5, seed: int = 1) -> Iterator[BlockEvent]:
+    '''
+    block events by the given number of players, a near_project share of them happen inside the
+    bounding box of a random tracker, the rest anywhere in the world
+    '''
+    rng = random.Random(seed)
+    areas = [area for area in (tracker.effective_area() for tracker in tracker_registry.trackers)
+             if area is not None and {"x_min", "x_max", "z_min", "z_max"} <= area.keys()]
+    for _ in range(count):
+        if areas and rng.random() < near_project:
+            area = rng.choice(areas)
+            x = rng.uniform(area["x_min"], area["x_max"] + 1)
+            z = rng.uniform(area["z_min"], area["z_max"] + 1)
+            y = rng.uniform(area.get("y_min", -64), area.get("y_max", 320) + 1)
+        else:
+            x = rng.uniform(-world_size / 2, world_size / 2)
+            z = rng.uniform(-world_size / 2, world_size / 2)
+            y = rng.uniform(-64, 320)
+        block = rng.choice(BLOCKS)
+        state = {"type": rng.choice(["top", "bottom", "double"]), "waterlogged": rng.random() < 0.2} \
+            if block == "smooth_stone_slab" else {}
+        yield BlockEvent(f"player_{rng.randrange(players)}", rng.choice(TRACKER_TYPES), (x, y, z), block, state)